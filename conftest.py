@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_settings():
+    """The settings core.runner.TestRunner gives manage.py test"""
+    from core.runner import isolated_settings
+    with isolated_settings():
+        yield
@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from api import views as api_views
+from posts import views as posts_views
+
+
+class Command(BaseCommand):
+    help = 'Compare CPU time per page: HTML feed pages against the JSON API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def measure(self, view, path, count):
+        factory = RequestFactory()
+        started = time.process_time()
+        for _ in range(count):
+            request = factory.get(path)
+            request.user = AnonymousUser()
+            response = view(request)
+        return (time.process_time() - started) / count, len(response.content)
+
+    def handle(self, *args, **options):
+        for name, view, path in (
+            # the page cache is left out, every request renders
+            ('html', posts_views.index.__wrapped__, '/'),
+            ('json', api_views.index, '/api/posts/'),
+        ):
+            cpu, size = self.measure(view, path, options['requests'])
+            self.stdout.write(
+                f'{name}: {cpu * 1000:.2f} ms/page, {size} bytes'
+            )
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from core.asgi import run_orm
+from posts.caching import feed_version_key, feed_versions
+from posts.models import Post
+from posts.utils import decode_cursor, encode_cursor
+
+# newest posts sent to a client at once
+BATCH_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+class WatchStopped(Exception):
+    """The watcher ended, the batch a client waits for never comes"""
+
+
+class _Cursor:
+    __slots__ = ('pub_date', 'pk')
+
+    def __init__(self, pub_date, pk):
+        self.pub_date = pub_date
+        self.pk = pk
+
+
+def _serialize(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date,
+        'updated': post.updated,
+        'author': post.author.username,
+        'group': post.group.slug if post.group else None,
+    }
+
+
+def _newer(post, since):
+    return since is None or (post.pub_date, post.pk) > since
+
+
+def _matches(post, filters):
+    group = filters.get('group')
+    author = filters.get('author')
+    return (
+        (group is None or (post.group and post.group.slug == group))
+        and (author is None or post.author.username == author)
+    )
+
+
+def posts_since(since, filters=None):
+    """Up to BATCH_SIZE posts after a (pub_date, id) cursor, oldest first"""
+    posts = Post.objects.rows().order_by('pub_date', 'pk')
+    filters = filters or {}
+    if filters.get('group'):
+        posts = posts.filter(group__slug=filters['group'])
+    if filters.get('author'):
+        posts = posts.filter(author__username=filters['author'])
+    if since is not None:
+        pub_date, pk = since
+        posts = posts.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+        )
+    return list(posts[:BATCH_SIZE])
+
+
+def newest_cursor():
+    post = Post.objects.only('pub_date').order_by('-pub_date', '-pk').first()
+    if post is not None:
+        return post.pub_date, post.pk
+
+
+class NewPosts:
+    """New posts of the global feed, watched once for every client.
+
+    While anybody listens, one task checks the feed version each
+    STREAM_POLL_INTERVAL seconds and reads the new posts when it moves.
+    Each batch resolves a future holding the posts and the future of the
+    next batch, so a client following the chain never misses one.
+
+    Failed reads are retried with a growing delay. Should the task end
+    while clients still wait, their future fails with WatchStopped.
+    """
+
+    def __init__(self):
+        self.listeners = 0
+        self.task = None
+        self.head = None
+
+    def listen(self):
+        """Future of the next batch, call forget() when done"""
+        self.listeners += 1
+        if self.task is None or self.task.done():
+            self.head = asyncio.get_running_loop().create_future()
+            self.task = asyncio.ensure_future(self.watch())
+        return self.head
+
+    def forget(self):
+        self.listeners -= 1
+
+    async def _read(self, function, *args):
+        """run_orm(function, *args), retried while anybody listens"""
+        delay = settings.STREAM_POLL_INTERVAL
+        while True:
+            try:
+                return await run_orm(function, *args)
+            except Exception:
+                if self.listeners <= 0:
+                    raise
+                logger.exception('Reading new posts failed')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.STREAM_RETRY_MAX)
+
+    async def watch(self):
+        try:
+            await self._watch()
+        finally:
+            head = self.head
+            if not head.done():
+                if self.listeners > 0:
+                    head.set_exception(WatchStopped())
+                else:
+                    head.cancel()
+
+    async def _watch(self):
+        keys = [feed_version_key('global')]
+        version = await self._read(feed_versions, keys)
+        cursor = await self._read(newest_cursor)
+        while self.listeners > 0:
+            await asyncio.sleep(settings.STREAM_POLL_INTERVAL)
+            current = await self._read(feed_versions, keys)
+            if current == version:
+                continue
+            posts = await self._read(posts_since, cursor)
+            if len(posts) < BATCH_SIZE:
+                # a full batch is read on until the rest is fetched
+                version = current
+            if not posts:
+                continue
+            cursor = posts[-1].pub_date, posts[-1].pk
+            batch = asyncio.get_running_loop().create_future()
+            self.head, head = batch, self.head
+            head.set_result((posts, batch))
+
+
+new_posts = NewPosts()
+
+
+def _params(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    return {name: values[-1] for name, values in query.items()}
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _send_json(send, data, status=200):
+    body = json.dumps(data, cls=DjangoJSONEncoder).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'cache-control', b'no-cache'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def long_poll(scope, receive, send):
+    """Answer with the posts after ?since= as soon as there are any.
+
+    Without new posts the response is empty after ?timeout= seconds,
+    STREAM_TIMEOUT at most. ?group= and ?author= narrow the feed.
+    """
+    params = _params(scope)
+    filters = {k: params[k] for k in ('group', 'author') if params.get(k)}
+    try:
+        timeout = min(float(params.get('timeout', settings.STREAM_TIMEOUT)),
+                      settings.STREAM_TIMEOUT)
+    except ValueError:
+        timeout = settings.STREAM_TIMEOUT
+    since = decode_cursor(params.get('since'))
+    batch = new_posts.listen()
+    try:
+        if since is None:
+            since = await run_orm(newest_cursor)
+        posts = await run_orm(posts_since, since, filters)
+        disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not posts and not disconnect.done():
+            done, _ = await asyncio.wait(
+                [batch, disconnect],
+                timeout=max(deadline - loop.time(), 0),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if batch not in done:
+                break
+            try:
+                new, batch = batch.result()
+            except WatchStopped:
+                # answered empty, the client polls again
+                break
+            posts = [
+                post for post in new
+                if _newer(post, since) and _matches(post, filters)
+            ]
+        disconnect.cancel()
+    finally:
+        new_posts.forget()
+    if posts:
+        since = posts[-1].pub_date, posts[-1].pk
+    await _send_json(send, {
+        'results': [_serialize(post) for post in posts],
+        'since': encode_cursor(_Cursor(*since)) if since else None,
+    })
+
+
+def _event(post):
+    data = json.dumps(_serialize(post), cls=DjangoJSONEncoder)
+    return f'id: {encode_cursor(post)}\nevent: post\ndata: {data}\n\n'
+
+
+async def events(scope, receive, send):
+    """Server-sent events, one per new post of the feed.
+
+    Starts after ?since= or the Last-Event-ID of a reconnecting client,
+    reading a backlog of any length before the new posts, and sends a
+    comment every STREAM_HEARTBEAT seconds to keep proxies from closing
+    the idle connection.
+    """
+    params = _params(scope)
+    filters = {k: params[k] for k in ('group', 'author') if params.get(k)}
+    headers = dict(scope.get('headers', []))
+    since = decode_cursor(
+        headers.get(b'last-event-id', b'').decode() or params.get('since')
+    )
+    batch = new_posts.listen()
+    disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        if since is None:
+            since = await run_orm(newest_cursor)
+            posts = []
+        else:
+            posts = await run_orm(posts_since, since, filters)
+        # batches start at the newest post, a longer backlog is read on
+        behind = len(posts) == BATCH_SIZE
+        while not disconnect.done():
+            posts = [
+                post for post in posts
+                if _newer(post, since) and _matches(post, filters)
+            ]
+            if posts:
+                since = posts[-1].pub_date, posts[-1].pk
+            body = ''.join(_event(post) for post in posts) or ': ping\n\n'
+            await send({
+                'type': 'http.response.body',
+                'body': body.encode(),
+                'more_body': True,
+            })
+            if behind:
+                posts = await run_orm(posts_since, since, filters)
+                behind = len(posts) == BATCH_SIZE
+                continue
+            done, _ = await asyncio.wait(
+                [batch, disconnect],
+                timeout=settings.STREAM_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            posts = []
+            if batch in done:
+                try:
+                    posts, batch = batch.result()
+                except WatchStopped:
+                    # the client reconnects with its Last-Event-ID
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+    finally:
+        disconnect.cancel()
+        new_posts.forget()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+
+from api import streams
+from core.asgi import run_orm
+from posts.models import Post
+from posts.utils import encode_cursor
+from yatube.asgi import application
+
+User = get_user_model()
+
+
+async def _call(path, query='', until=None, during=None):
+    """Messages sent for a request, the client leaves once until() holds"""
+    messages = []
+    left = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b''}
+        await left.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+        if until is not None and until(messages):
+            left.set()
+
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'query_string': query.encode(),
+        'headers': [],
+    }
+    tasks = [application(scope, receive, send)]
+    if during is not None:
+        tasks.append(during())
+    await asyncio.gather(*tasks)
+    return messages
+
+
+def _body(messages):
+    return b''.join(m.get('body', b'') for m in messages[1:]).decode()
+
+
+@override_settings(STREAM_POLL_INTERVAL=0.05)
+class StreamTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(author=self.user, text='first')
+
+    def test_long_poll_backlog(self):
+        newer = Post.objects.create(author=self.user, text='second')
+        messages = asyncio.run(_call(
+            '/api/stream/poll/', f'since={encode_cursor(self.post)}'
+        ))
+        data = json.loads(_body(messages))
+        self.assertEqual([p['text'] for p in data['results']], ['second'])
+        self.assertEqual(data['since'], encode_cursor(newer))
+
+    def test_long_poll_waits_for_new_posts(self):
+        async def publish():
+            await asyncio.sleep(0.2)
+            await run_orm(
+                Post.objects.create, author=self.user, text='second'
+            )
+
+        messages = asyncio.run(_call(
+            '/api/stream/poll/', 'timeout=5', during=publish
+        ))
+        data = json.loads(_body(messages))
+        self.assertEqual([p['text'] for p in data['results']], ['second'])
+
+    def test_long_poll_survives_failed_read(self):
+        versions = streams.feed_versions
+        calls = []
+
+        def flaky(keys):
+            calls.append(keys)
+            if len(calls) == 1:
+                raise ConnectionError('cache went away')
+            return versions(keys)
+
+        async def publish():
+            await asyncio.sleep(0.3)
+            await run_orm(
+                Post.objects.create, author=self.user, text='second'
+            )
+
+        with mock.patch.object(streams, 'feed_versions', flaky), \
+                self.assertLogs('api.streams', 'ERROR'):
+            messages = asyncio.run(_call(
+                '/api/stream/poll/', 'timeout=5', during=publish
+            ))
+        data = json.loads(_body(messages))
+        self.assertEqual([p['text'] for p in data['results']], ['second'])
+
+    def test_long_poll_watcher_stopped(self):
+        async def stop():
+            await asyncio.sleep(0.2)
+            streams.new_posts.task.cancel()
+
+        loop_time = []
+
+        async def call():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            messages = await _call('/api/stream/poll/', 'timeout=5',
+                                   during=stop)
+            loop_time.append(loop.time() - start)
+            return messages
+
+        messages = asyncio.run(call())
+        self.assertEqual(json.loads(_body(messages))['results'], [])
+        self.assertLess(loop_time[0], 5)
+
+    def test_long_poll_timeout(self):
+        messages = asyncio.run(_call('/api/stream/poll/', 'timeout=0.1'))
+        self.assertEqual(json.loads(_body(messages))['results'], [])
+
+    def test_events(self):
+        Post.objects.create(author=self.user, text='second')
+        messages = asyncio.run(_call(
+            '/api/stream/events/',
+            f'since={encode_cursor(self.post)}',
+            until=lambda messages: 'event: post' in _body(messages)
+        ))
+        self.assertEqual(
+            dict(messages[0]['headers'])[b'content-type'],
+            b'text/event-stream'
+        )
+        self.assertIn('"text": "second"', _body(messages))
+
+    def test_events_long_backlog(self):
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'backlog {i}')
+            for i in range(streams.BATCH_SIZE + 50)
+        )
+        messages = asyncio.run(asyncio.wait_for(_call(
+            '/api/stream/events/',
+            f'since={encode_cursor(self.post)}',
+            until=lambda messages: _body(messages).count('event: post')
+            >= streams.BATCH_SIZE + 50
+        ), 5))
+        body = _body(messages)
+        self.assertEqual(body.count('event: post'), streams.BATCH_SIZE + 50)
+        self.assertIn(f'"text": "backlog {streams.BATCH_SIZE + 49}"', body)
+
+    def test_django_through_bridge(self):
+        messages = asyncio.run(_call('/about/tech/'))
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertFalse(messages[-1].get('more_body', False))
@@ -0,0 +1,101 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test group',
+            slug='test-slug',
+            description='test desc',
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group,
+                text=f'test text {i}',
+            )
+            for i in range(13)
+        ]
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.posts[0],
+                author=cls.reader,
+                text=f'comment {i}',
+            )
+            for i in range(12)
+        ]
+
+    def setUp(self):
+        self.guest = Client()
+        self.auth = Client()
+        self.auth.force_login(self.reader)
+
+    def test_feeds(self):
+        newest = self.posts[-1]
+        for address, queries in (
+            (reverse('api:index'), 1),
+            (reverse('api:group', args=[self.group.slug]), 2),
+            (reverse('api:profile', args=[self.user.username]), 2),
+        ):
+            with self.subTest(address=address):
+                with self.assertNumQueries(queries):
+                    response = self.guest.get(address)
+                data = response.json()
+                self.assertEqual(len(data['results']), 10)
+                self.assertEqual(data['results'][0]['text'], newest.text)
+                self.assertEqual(data['results'][0]['author'], 'auth')
+                self.assertIsNone(data['previous'])
+                data = self.guest.get(data['next']).json()
+                self.assertEqual(len(data['results']), 3)
+                self.assertIsNone(data['next'])
+                data = self.guest.get(data['previous']).json()
+                self.assertEqual(data['results'][0]['text'], newest.text)
+
+    def test_fields(self):
+        response = self.guest.get(
+            reverse('api:post_detail', args=[self.posts[0].pk]),
+            {'fields': 'id,text'}
+        )
+        self.assertEqual(response.json(), {
+            'id': self.posts[0].pk,
+            'text': self.posts[0].text,
+        })
+        response = self.guest.get(reverse('api:index'), {'fields': 'secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_follow(self):
+        address = reverse('api:follow_index')
+        self.assertEqual(self.guest.get(address).status_code, 401)
+        self.assertEqual(self.auth.get(address).json()['results'], [])
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(len(self.auth.get(address).json()['results']), 10)
+
+    def test_comments(self):
+        address = reverse('api:comments', args=[self.posts[0].pk])
+        data = self.guest.get(address).json()
+        self.assertEqual(data['results'][0]['text'], 'comment 0')
+        data = self.guest.get(data['next']).json()
+        self.assertEqual([c['text'] for c in data['results']],
+                         ['comment 10', 'comment 11'])
+        self.assertIsNone(data['next'])
+
+    def test_not_found(self):
+        for address in (
+            reverse('api:group', args=['nope']),
+            reverse('api:profile', args=['nope']),
+            reverse('api:post_detail', args=[0]),
+            reverse('api:comments', args=[0]),
+        ):
+            with self.subTest(address=address):
+                response = self.guest.get(address)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('detail', response.json())
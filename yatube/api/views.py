@@ -0,0 +1,180 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+
+from posts.models import Comment, Group, Post, User
+from posts.timeline import FollowFeed
+from posts.utils import POSTS_PER_PAGE, CursorPaginator, decode_cursor
+
+# API field: column it is read from
+POST_FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'updated': 'updated',
+    'image': 'image',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+}
+
+
+class FieldError(Exception):
+    pass
+
+
+def _json(data, status=200):
+    return JsonResponse(
+        data, status=status, encoder=DjangoJSONEncoder,
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def _error(detail, status):
+    return _json({'detail': detail}, status=status)
+
+
+def _fields(request, available):
+    """API fields asked for with ?fields=a,b, all of them by default"""
+    names = request.GET.get('fields')
+    if not names:
+        return list(available)
+    names = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise FieldError(f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def _serializer(request, fields, available):
+    columns = [available[name] for name in fields]
+
+    def serialize(row):
+        data = dict(zip(fields, (getattr(row, c) for c in columns)))
+        if data.get('image'):
+            data['image'] = request.build_absolute_uri(
+                settings.MEDIA_URL + data['image']
+            )
+        return data
+    return serialize
+
+
+def _rows(queryset, fields, available):
+    """Only the selected columns as named tuples, plus the cursor key"""
+    columns = {available[name] for name in fields} | {'pk', 'pub_date'}
+    return queryset.values_list(*columns, named=True)
+
+
+def _page_url(request, **params):
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    for key, value in params.items():
+        query[key] = value
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def _post_page(request, posts, feed=None):
+    """Cursor page of posts, ?after= and ?before= move along the feed
+
+    feed wraps the selected rows when the feed is merged from several
+    queries, as timeline.FollowFeed.
+    """
+    try:
+        fields = _fields(request, POST_FIELDS)
+    except FieldError as error:
+        return _error(str(error), 400)
+    rows = _rows(posts, fields, POST_FIELDS)
+    if feed is not None:
+        rows = feed(rows)
+    page = CursorPaginator(rows, POSTS_PER_PAGE).get_cursor_page(
+        after=decode_cursor(request.GET.get('after')),
+        before=decode_cursor(request.GET.get('before')),
+    )
+    serialize = _serializer(request, fields, POST_FIELDS)
+    return _json({
+        'results': [serialize(row) for row in page],
+        'next': _page_url(request, after=page.next_cursor)
+        if page.has_next() else None,
+        'previous': _page_url(request, before=page.previous_cursor)
+        if page.has_previous() else None,
+    })
+
+
+@require_safe
+def index(request):
+    """All posts, newest first"""
+    return _post_page(request, Post.objects.all())
+
+
+@require_safe
+def group_posts(request, slug):
+    """Posts of a group"""
+    if not Group.objects.filter(slug=slug).exists():
+        return _error('Group not found', 404)
+    return _post_page(request, Post.objects.filter(group__slug=slug))
+
+
+@require_safe
+def profile(request, username):
+    """Posts of an author"""
+    author = User.objects.filter(username=username).values('pk').first()
+    if author is None:
+        return _error('User not found', 404)
+    return _post_page(request, Post.objects.filter(author=author['pk']))
+
+
+@require_safe
+def follow_index(request):
+    """Posts of the authors the user follows"""
+    if not request.user.is_authenticated:
+        return _error('Authentication required', 401)
+    return _post_page(
+        request, Post.objects.all(), partial(FollowFeed, request.user)
+    )
+
+
+@require_safe
+def post_detail(request, post_id):
+    """One post"""
+    try:
+        fields = _fields(request, POST_FIELDS)
+    except FieldError as error:
+        return _error(str(error), 400)
+    row = _rows(Post.objects.filter(pk=post_id), fields, POST_FIELDS).first()
+    if row is None:
+        return _error('Post not found', 404)
+    return _json(_serializer(request, fields, POST_FIELDS)(row))
+
+
+@require_safe
+def comments(request, post_id):
+    """Comments of a post, oldest first, ?after= takes the last id seen"""
+    try:
+        fields = _fields(request, COMMENT_FIELDS)
+    except FieldError as error:
+        return _error(str(error), 400)
+    if not Post.objects.filter(pk=post_id).exists():
+        return _error('Post not found', 404)
+    columns = {COMMENT_FIELDS[name] for name in fields} | {'pk'}
+    rows = Comment.objects.filter(post=post_id).order_by('pk')
+    after = request.GET.get('after')
+    if after and after.isdigit():
+        rows = rows.filter(pk__gt=after)
+    rows = list(rows.values_list(*columns, named=True)[:POSTS_PER_PAGE + 1])
+    serialize = _serializer(request, fields, COMMENT_FIELDS)
+    has_next = len(rows) > POSTS_PER_PAGE
+    rows = rows[:POSTS_PER_PAGE]
+    return _json({
+        'results': [serialize(row) for row in rows],
+        'next': _page_url(request, after=rows[-1].pk) if has_next else None,
+    })
@@ -0,0 +1,160 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db import close_old_connections
+
+# request bodies past this size are spooled to a temporary file
+BODY_MEMORY_LIMIT = 1024 * 1024
+
+_executor = None
+
+
+def executor():
+    """The one thread pool of the process, ASGI_THREADS threads at most"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS,
+            thread_name_prefix='asgi'
+        )
+    return _executor
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run blocking code on the pool, the event loop keeps serving"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor(), partial(func, *args, **kwargs)
+    )
+
+
+def _with_connections(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_orm(func, *args, **kwargs):
+    """run_sync for ORM code, stale connections of the thread are closed"""
+    return await run_sync(_with_connections, func, *args, **kwargs)
+
+
+def _environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+class WsgiBridge:
+    """Serve a WSGI application to an ASGI server.
+
+    The application and every read of its response run on the shared
+    pool, so a slow client holds a coroutine rather than a thread.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await lifespan(scope, receive, send)
+        body = SpooledTemporaryFile(max_size=BODY_MEMORY_LIMIT)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+
+        response = await run_sync(
+            self.application, _environ(scope, body), start_response
+        )
+        try:
+            chunks = iter(response)
+            chunk = await run_sync(next, chunks, None)
+            await send({
+                'type': 'http.response.start',
+                'status': started['status'],
+                'headers': started['headers'],
+            })
+            while chunk is not None:
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+                chunk = await run_sync(next, chunks, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(response, 'close'):
+                await run_sync(response.close)
+            body.close()
+
+
+async def lifespan(scope, receive, send):
+    global _executor
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+                _executor = None
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+class Router:
+    """Send HTTP paths in routes to their handlers, the rest to default"""
+
+    def __init__(self, routes, default):
+        self.routes = routes
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        handler = None
+        if scope['type'] == 'http':
+            handler = self.routes.get(scope['path'])
+        await (handler or self.default)(scope, receive, send)
@@ -0,0 +1,225 @@
+import os
+import pickle
+import sqlite3
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+'''
+
+
+class SQLiteCache(BaseCache):
+    """Cache shared by every process on the host through one SQLite file.
+
+    LOCATION is the database path. Entries past MAX_ENTRIES are evicted
+    least recently used first, 1/CULL_FREQUENCY of them at a time. Writes
+    run in immediate transactions, so incr is atomic across processes.
+
+    Reads do not write: the read times of the entries they touch are kept
+    and written together at most once per touch_interval, and before a
+    cull. The size of the table is counted once per cull_sample-th part
+    of MAX_ENTRIES writes, so it may run over by that many entries per
+    process before it is culled.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    # seconds the LRU clock of an entry may lag behind its last read
+    touch_interval = 10
+    cull_sample = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = os.path.abspath(location)
+        self._connection = None
+        self._pid = None
+        self._touched = {}
+        self._flushed = 0
+        self._writes = 0
+        self._cull_every = max(1, self._max_entries // self.cull_sample)
+
+    @property
+    def _db(self):
+        # django.core.cache.caches hands every thread its own backend, a
+        # forked worker must not reuse the connection of its parent
+        if self._connection is None or self._pid != os.getpid():
+            db = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._connection = db
+            self._pid = os.getpid()
+        return self._connection
+
+    def _write(self, queries):
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = queries(db)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return result
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _touch(self, db):
+        db.executemany(
+            'UPDATE cache SET accessed = ? WHERE key = ?',
+            [(accessed, key) for key, accessed in self._touched.items()]
+        )
+        self._touched.clear()
+        self._flushed = time.time()
+
+    def _cull(self, db):
+        self._writes += 1
+        if self._writes < self._cull_every:
+            return
+        self._writes = 0
+        self._touch(db)
+        now = time.time()
+        db.execute('DELETE FROM cache WHERE expires < ?', (now,))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            db.execute('DELETE FROM cache')
+            return
+        db.execute(
+            'DELETE FROM cache WHERE key IN '
+            '(SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,)
+        )
+
+    def _store(self, db, rows, timeout, replace=True):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        verb = 'REPLACE' if replace else 'IGNORE'
+        cursor = db.executemany(
+            f'INSERT OR {verb} INTO cache VALUES (?, ?, ?, ?)',
+            [(key, self._dumps(value), expires, now) for key, value in rows]
+        )
+        self._cull(db)
+        return cursor.rowcount
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._get_many([key]).get(key, default)
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            'SELECT key, value, expires, accessed FROM cache '
+            f'WHERE key IN ({", ".join("?" * len(keys))})',
+            keys
+        ).fetchall()
+        found = {}
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires < now:
+                continue
+            found[key] = pickle.loads(value)
+            if accessed < now - self.touch_interval:
+                self._touched[key] = now
+        if self._touched and now - self._flushed >= self.touch_interval:
+            self._write(self._touch)
+        return found
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_key(key, version=version): key for key in keys}
+        for key in keys:
+            self.validate_key(key)
+        found = self._get_many(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(lambda db: self._store(db, [(key, value)], timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, value))
+        self._write(lambda db: self._store(db, rows, timeout))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def add(db):
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires < ?',
+                (key, time.time())
+            )
+            return self._store(db, [(key, value)], timeout, replace=False)
+        return self._write(add) == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires >= ?)',
+            (self.get_backend_timeout(timeout), key, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def incr(db):
+            row = db.execute(
+                'SELECT value FROM cache '
+                'WHERE key = ? AND (expires IS NULL OR expires >= ?)',
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                (self._dumps(value), time.time(), key)
+            )
+            return value
+        return self._write(incr)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._db.execute(
+            'SELECT 1 FROM cache '
+            'WHERE key = ? AND (expires IS NULL OR expires >= ?)',
+            (key, time.time())
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        self._db.executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+        )
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
@@ -0,0 +1,86 @@
+import re
+import struct
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .media import accepts
+
+# gzip member header: deflate, no flags, no mtime, unknown OS
+HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+# an empty final deflate block, closing a stitched stream
+FINAL = b'\x03\x00'
+
+
+def compressible(response):
+    """A 200 of a type in COMPRESSION_TYPES, not encoded yet"""
+    content_type = response.get('Content-Type', '').split(';')[0]
+    return (
+        response.status_code == 200
+        and not response.has_header('Content-Encoding')
+        and content_type.strip().lower() in settings.COMPRESSION_TYPES
+    )
+
+
+def wanted(request, response):
+    return compressible(response) and accepts(request, 'gzip')
+
+
+def compress(data):
+    """data as one gzip member at COMPRESSION_LEVEL"""
+    compressor = zlib.compressobj(
+        settings.COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+    )
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks):
+    """Gzip a streaming body chunk by chunk, as zlib hands output over"""
+    compressor = zlib.compressobj(
+        settings.COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+    )
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def deflate(data):
+    """Raw deflate of data ending on a byte boundary, a piece for stitch()"""
+    compressor = zlib.compressobj(
+        settings.COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS
+    )
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def stitch(parts, deflated):
+    """One gzip member of parts, deflated pieces used where given.
+
+    Each piece is a complete run of deflate blocks that refers to no
+    earlier data, so pieces made at different times can be joined; only
+    the parts without one are compressed now. The checksum still reads
+    every byte, at a small fraction of the cost of compressing them.
+    """
+    crc = 0
+    size = 0
+    body = [HEADER]
+    for part, piece in zip(parts, deflated):
+        crc = zlib.crc32(part, crc)
+        size += len(part)
+        body.append(piece if piece is not None else deflate(part))
+    body.append(FINAL)
+    body.append(struct.pack('<II', crc, size & 0xffffffff))
+    return b''.join(body)
+
+
+def mark(response):
+    """Headers of a response whose body has just been gzipped"""
+    response['Content-Encoding'] = 'gzip'
+    if not response.streaming:
+        response['Content-Length'] = len(response.content)
+    # the encoded body is a different byte sequence, its ETag is weak
+    if response.has_header('ETag'):
+        response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+    patch_vary_headers(response, ['Accept-Encoding'])
@@ -0,0 +1,43 @@
+import json
+import re
+from contextlib import contextmanager
+
+from django.template.loader import render_to_string
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.utils.safestring import mark_safe
+
+HOLE_RE = re.compile(r'<!--hole ([\w-]+)-->')
+
+
+@contextmanager
+def punched(request):
+    """Render pages inside the block for a cache shared by every user"""
+    request.punch_holes = True
+    try:
+        yield
+    finally:
+        request.punch_holes = False
+
+
+def hole(request, template_name, params):
+    """A per-user template, or its marker while the page goes to the cache"""
+    if getattr(request, 'punch_holes', False):
+        payload = json.dumps([template_name, params]).encode()
+        return mark_safe(f'<!--hole {urlsafe_base64_encode(payload)}-->')
+    return render_to_string(template_name, params, request=request)
+
+
+def split(content):
+    """Parts of a cached page, every odd one the payload of a hole"""
+    return HOLE_RE.split(content)
+
+
+def render(payload, request):
+    """The per-user template of a hole for the current request"""
+    template_name, params = json.loads(urlsafe_base64_decode(payload))
+    return render_to_string(template_name, params, request=request)
+
+
+def fill(content, request):
+    """Render every hole of a cached page for the current request"""
+    return HOLE_RE.sub(lambda match: render(match.group(1), request), content)
@@ -0,0 +1,31 @@
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('collectstatic, then report the hashed files and the bytes '
+            'their .gz siblings save')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true')
+
+    def handle(self, *args, **options):
+        call_command(
+            'collectstatic', interactive=False, clear=options['clear'],
+            verbosity=options['verbosity']
+        )
+        storage = staticfiles_storage
+        storage.hashed_files = storage.load_manifest()
+        names = sorted(set(storage.hashed_files.values()))
+        total = compressed = 0
+        for name in names:
+            size = storage.size(name)
+            total += size
+            gz = f'{name}.gz'
+            compressed += storage.size(gz) if storage.exists(gz) else size
+        saved = 1 - compressed / total if total else 0
+        self.stdout.write(
+            f'{len(names)} hashed files, {total / 1024:.0f} kB, '
+            f'{compressed / 1024:.0f} kB sent gzipped ({saved:.0%} saved)'
+        )
@@ -0,0 +1,55 @@
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = 'Time set, get, get_many and incr on the available cache backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+
+    def backends(self, directory):
+        params = {'OPTIONS': {'MAX_ENTRIES': 100000}}
+        return {
+            'locmem': LocMemCache('benchmark', params),
+            'filebased': FileBasedCache(f'{directory}/files', params),
+            'sqlite': SQLiteCache(f'{directory}/cache.sqlite3', params),
+        }
+
+    def handle(self, *args, **options):
+        keys = [f'key:{i}' for i in range(options['keys'])]
+        value = {'content': 'x' * 2000, 'content_type': 'text/html'}
+        directory = tempfile.mkdtemp()
+        try:
+            for name, cache in self.backends(directory).items():
+                cache.set('counter', 0)
+                timings = {}
+                start = time.perf_counter()
+                for key in keys:
+                    cache.set(key, value)
+                timings['set'] = time.perf_counter() - start
+                start = time.perf_counter()
+                for key in keys:
+                    cache.get(key)
+                timings['get'] = time.perf_counter() - start
+                start = time.perf_counter()
+                for i in range(0, len(keys), 10):
+                    cache.get_many(keys[i:i + 10])
+                timings['get_many'] = time.perf_counter() - start
+                start = time.perf_counter()
+                for key in keys:
+                    cache.incr('counter')
+                timings['incr'] = time.perf_counter() - start
+                self.stdout.write(f'{name}: ' + ' '.join(
+                    f'{op}={seconds * 1000000 / len(keys):.1f}us'
+                    for op, seconds in timings.items()
+                ))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,190 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, StreamingHttpResponse
+)
+from django.utils._os import safe_join
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+HASHED = re.compile(r'[0-9a-f]{64}')
+# the name ManifestStaticFilesStorage gives a file: name.<md5[:12]>.ext
+STATIC_HASHED = re.compile(r'.+\.[0-9a-f]{12}(\.[^./]+)?')
+CHUNK_SIZE = 64 * 1024
+
+
+def _etag(path, stat):
+    """The content hash of a hashed name, else mtime and size as nginx"""
+    stem = posixpath.splitext(posixpath.basename(path))[0]
+    if HASHED.fullmatch(stem):
+        return f'"{stem}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def byte_range(header, size):
+    """(start, end) of a single Range header, None for the whole file.
+
+    end is inclusive. Raises ValueError for a range past the end of the
+    file. Several ranges at once are answered with the whole file.
+    """
+    match = RANGE.fullmatch(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # the last n bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def accepts(request, coding):
+    """Whether Accept-Encoding allows a content coding such as gzip"""
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = part.partition(';')
+        if name.strip().lower() in (coding, '*'):
+            quality = params.replace(' ', '').lower()
+            return not re.fullmatch(r'q=0(\.0*)?', quality)
+    return False
+
+
+def _find(root, path):
+    try:
+        full_path = safe_join(root, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404(path)
+    if not os.path.isfile(full_path):
+        raise Http404(path)
+    return full_path, stat
+
+
+def _read(full_path, start, length):
+    # opened once the body is read, a HEAD or a client gone before it
+    # leaves nothing open
+    with open(full_path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(path, full_path):
+    # the front server sends the body and answers ranges itself
+    response = HttpResponse()
+    if settings.MEDIA_OFFLOAD == 'sendfile':
+        response['X-Sendfile'] = full_path
+    else:
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_ACCEL_PREFIX + path
+        )
+    return response
+
+
+def _respond(request, full_path, stat, etag):
+    size = stat.st_size
+    requested = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if requested and if_range in (None, etag):
+        try:
+            span = byte_range(requested, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if span is not None:
+            start, end = span
+            response = StreamingHttpResponse(
+                _read(full_path, start, end - start + 1), status=206
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+            return response
+    # a whole file goes out through wsgi.file_wrapper, sendfile() where
+    # the server has it
+    return FileResponse(open(full_path, 'rb'))
+
+
+def _send(request, path, full_path, stat, respond=_respond):
+    """The file or a 304, with validators and its content type"""
+    etag = _etag(path, stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        response = respond(request, full_path, stat, etag)
+    if response.status_code in (200, 206):
+        content_type = mimetypes.guess_type(path)[0]
+        response['Content-Type'] = content_type or 'application/octet-stream'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve(request, path):
+    """A file under MEDIA_ROOT, sent by the front server with MEDIA_OFFLOAD.
+
+    Uploads and thumbnails never change under their names, browsers and
+    proxies keep them MEDIA_CACHE_TIMEOUT seconds without asking again.
+    """
+    full_path, stat = _find(settings.MEDIA_ROOT, path)
+    respond = _respond
+    if settings.MEDIA_OFFLOAD:
+        def respond(request, full_path, stat, etag):
+            return _offload(path, full_path)
+    response = _send(request, path, full_path, stat, respond)
+    patch_cache_control(
+        response, public=True, max_age=settings.MEDIA_CACHE_TIMEOUT,
+        immutable=True
+    )
+    return response
+
+
+@require_safe
+def serve_static(request, path):
+    """A collected file under STATIC_ROOT, its .gz to clients taking gzip.
+
+    Names with the content hash from the manifest are immutable for
+    STATIC_CACHE_TIMEOUT seconds, plain names are revalidated each time.
+    """
+    full_path, stat = _find(settings.STATIC_ROOT, path)
+    encoding = None
+    if accepts(request, 'gzip'):
+        try:
+            full_path, stat = _find(settings.STATIC_ROOT, f'{path}.gz')
+            encoding = 'gzip'
+        except Http404:
+            pass
+    response = _send(request, path, full_path, stat)
+    if encoding and response.status_code in (200, 206):
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if STATIC_HASHED.fullmatch(posixpath.basename(path)):
+        patch_cache_control(
+            response, public=True, max_age=settings.STATIC_CACHE_TIMEOUT,
+            immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
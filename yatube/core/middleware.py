@@ -0,0 +1,80 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+
+from . import compression
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudgetMiddleware:
+    """Report views that issue more than QUERY_BUDGET queries.
+
+    Active only with DEBUG on. Logs a warning, or raises
+    QueryBudgetExceeded when QUERY_BUDGET_RAISE is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = self.get_response(request)
+        if len(queries) > settings.QUERY_BUDGET:
+            message = (
+                f'{request.method} {request.path} issued {len(queries)} '
+                f'queries, budget is {settings.QUERY_BUDGET}'
+            )
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class CompressionMiddleware:
+    """Gzip text responses at COMPRESSION_LEVEL, streams chunk by chunk.
+
+    Only 200s of COMPRESSION_TYPES are compressed, bodies under
+    COMPRESSION_MIN_SIZE or not made smaller are sent as they are. Feed
+    pages from the page cache come gzipped already, see cache_feed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not compression.compressible(response):
+            return response
+        patch_vary_headers(response, ['Accept-Encoding'])
+        if not compression.accepts(request, 'gzip'):
+            return response
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(
+                response.streaming_content
+            )
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compressed = compression.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+        compression.mark(response)
+        return response
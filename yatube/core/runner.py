@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def isolated_settings():
+    """Settings of a test run.
+
+    SQLite caches live in a throwaway directory and thumbnails are made
+    in the render, so that no worker thread outlives its test database.
+    """
+    directory = tempfile.mkdtemp()
+    caches = {}
+    for alias, config in settings.CACHES.items():
+        if config['BACKEND'] == 'core.cache.SQLiteCache':
+            config = dict(
+                config, LOCATION=os.path.join(directory, f'{alias}.sqlite3')
+            )
+        caches[alias] = config
+    try:
+        with override_settings(CACHES=caches, THUMBNAIL_WORKERS=0):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner that leaves the caches of the project alone"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._isolated = isolated_settings()
+        self._isolated.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._isolated.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+# static files worth a .gz sibling, and the size below which it is not
+COMPRESSIBLE = (
+    '.css', '.js', '.map', '.json', '.svg', '.html', '.txt', '.xml', '.ico',
+    '.ttf', '.otf', '.eot',
+)
+COMPRESS_MIN_SIZE = 256
+
+
+def content_hash(content):
+    """SHA-256 of a file read in chunks, left at its start"""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Files named by the SHA-256 of their content, each stored once.
+
+    Saving content that is stored already returns the existing name
+    without writing, so every upload of the same bytes shares one file
+    and one set of thumbnails. The directory of the given name is kept,
+    its base name is replaced by the hash under a two character fan-out.
+    Deleting is left to the owner, who knows when a file is unreferenced:
+    it sets the file aside, checks again and puts it back if the file got
+    a new reference meanwhile. A reference committed after that check
+    calls restore() with its content to write the file again.
+    """
+
+    def hashed_name(self, name, content):
+        """The name content is stored under when saved as name"""
+        digest = content_hash(content)
+        directory, base = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(base)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def restore(self, name, content):
+        """Write content under its hashed name again if it is missing"""
+        if self.exists(name):
+            return
+        saved = super().save(name, content)
+        if saved != name:
+            # restored by somebody else meanwhile, the bytes are the same
+            self.delete(saved)
+
+    def set_aside(self, name):
+        """Move a file out of its name, returns where it went or None"""
+        aside = f'{name}.{uuid.uuid4().hex}.released'
+        try:
+            os.replace(self.path(name), self.path(aside))
+        except FileNotFoundError:
+            return None
+        return aside
+
+    def put_back(self, aside, name):
+        """Undo set_aside(), replacing a copy restored in the meantime"""
+        os.replace(self.path(aside), self.path(name))
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed static names from a manifest, with precompressed siblings.
+
+    collectstatic stores every file under a name carrying its content
+    hash and writes a gzipped .gz next to the text assets, for the front
+    server or core.media.serve_static to send as they are. Names missing
+    from the manifest, before collectstatic has run, stay unhashed.
+    """
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        stored = set()
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run, **options
+        ):
+            if hashed_name is not None:
+                stored.update((name, hashed_name))
+            yield name, hashed_name, processed
+        for name in sorted(stored):
+            if name.endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        """Write name.gz when gzip makes the file smaller"""
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < COMPRESS_MIN_SIZE:
+            return
+        # mtime 0 keeps builds of the same files byte for byte equal
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content):
+            return
+        if self.exists(name + '.gz'):
+            self.delete(name + '.gz')
+        self._save(name + '.gz', ContentFile(compressed))
@@ -0,0 +1,11 @@
+from django import template
+
+from core import holes
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **params):
+    """Include that stays per user inside a shared cached page"""
+    return holes.hole(context.get('request'), template_name, params)
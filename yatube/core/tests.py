@@ -1,4 +1,24 @@
-from django.test import TestCase
+import gzip
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zlib
+from unittest import mock
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+
+from .cache import SQLiteCache
+from . import compression
+from .middleware import CompressionMiddleware, QueryBudgetExceeded
+from .storage import ContentAddressedStorage
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +28,284 @@ class ViewTestClass(TestCase):
         # Проверьте, что используется шаблон core/404.html
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+    @override_settings(DEBUG=True, QUERY_BUDGET=0, QUERY_BUDGET_RAISE=True)
+    def test_query_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            Client().get('/group/nonexist/')
+        with override_settings(QUERY_BUDGET_RAISE=False):
+            with self.assertLogs('core.middleware', 'WARNING'):
+                Client().get('/group/nonexist/')
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.location = os.path.join(directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 2},
+        })
+
+    def test_get_set(self):
+        self.cache.set('a', {'value': 1})
+        self.assertEqual(self.cache.get('a'), {'value': 1})
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertTrue(self.cache.add('b', 2))
+        self.cache.set_many({'c': 3, 'd': 4})
+        self.assertEqual(self.cache.get_many(['b', 'c', 'x']),
+                         {'b': 2, 'c': 3})
+        self.cache.delete_many(['b', 'c'])
+        self.assertIsNone(self.cache.get('b'))
+        self.cache.set('e', 5, timeout=0)
+        self.assertFalse(self.cache.has_key('e'))
+
+    def test_incr(self):
+        self.cache.set('n', 1)
+        self.assertEqual(self.cache.incr('n', 2), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_lru_eviction(self):
+        for key in 'abcd':
+            self.cache.set(key, key)
+        self.cache._db.execute('UPDATE cache SET accessed = 0')
+        self.cache.get('a')
+        self.cache.set('e', 'e')
+        self.assertTrue(self.cache.has_key('a'))
+        self.assertTrue(self.cache.has_key('e'))
+        self.assertEqual(
+            sum(self.cache.has_key(key) for key in 'bcd'), 1
+        )
+
+    def test_reads_touch_in_batches(self):
+        self.cache.set('a', 'a')
+        self.cache._db.execute('UPDATE cache SET accessed = 0')
+        changes = self.cache._db.total_changes
+        for _ in range(3):
+            self.cache.get('a')
+        self.assertEqual(self.cache._db.total_changes, changes)
+        self.assertIn(self.cache.make_key('a'), self.cache._touched)
+        self.cache.touch_interval = 0
+        self.cache.get('a')
+        self.assertEqual(self.cache._db.total_changes, changes + 1)
+        self.assertEqual(self.cache._touched, {})
+
+    def test_cull_sampled(self):
+        cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        })
+        statements = []
+        cache._db.set_trace_callback(statements.append)
+        for i in range(20):
+            cache.set(i, i)
+        counts = [query for query in statements if 'COUNT(*)' in query]
+        self.assertEqual(len(counts), 2)
+
+    def test_shared_between_processes(self):
+        self.cache.set('n', 0)
+        other = SQLiteCache(self.location, {})
+        workers = [
+            multiprocessing.Process(target=_incr_many, args=(self.location,))
+            for _ in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(other.get('n'), 100)
+
+
+def _incr_many(location):
+    cache = SQLiteCache(location, {})
+    for _ in range(50):
+        cache.incr('n')
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=directory)
+
+    def test_same_content_stored_once(self):
+        first = self.storage.save('posts/a.JPG', ContentFile(b'meme'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'meme'))
+        other = self.storage.save('posts/c.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^posts/([0-9a-f]{2})/\1[0-9a-f]{62}\.jpg$')
+        directory = os.path.dirname(first)
+        self.assertEqual(self.storage.listdir(directory)[1], [
+            os.path.basename(first)
+        ])
+        with self.storage.open(first) as content:
+            self.assertEqual(content.read(), b'meme')
+
+
+class MediaViewTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(directory, 'posts'))
+        with open(os.path.join(directory, 'posts', 'a.png'), 'wb') as f:
+            f.write(b'0123456789')
+        self.url = '/media/posts/a.png'
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        for header, body, content_range in (
+            ('bytes=2-4', b'234', 'bytes 2-4/10'),
+            ('bytes=7-', b'789', 'bytes 7-9/10'),
+            ('bytes=-2', b'89', 'bytes 8-9/10'),
+            ('bytes=5-100', b'56789', 'bytes 5-9/10'),
+        ):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content), body
+                )
+                self.assertEqual(response['Content-Range'], content_range)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"changed"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_range_opened_when_read(self):
+        with mock.patch('core.media.open', create=True,
+                        side_effect=open) as opened:
+            response = self.client.head(self.url, HTTP_RANGE='bytes=2-4')
+            self.assertEqual(response.status_code, 206)
+            opened.assert_not_called()
+            response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+            self.assertEqual(b''.join(response.streaming_content), b'234')
+            opened.assert_called_once()
+
+    def test_offload(self):
+        with override_settings(MEDIA_OFFLOAD='accel'):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/posts/a.png'
+        )
+        self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_OFFLOAD='sendfile'):
+            response = self.client.get(self.url)
+        self.assertTrue(response['X-Sendfile'].endswith('posts/a.png'))
+
+    def test_outside_media_root(self):
+        for url in ('/media/../manage.py', '/media/posts/', '/media/b.png'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class StaticBuildTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        source = os.path.join(directory, 'source')
+        os.makedirs(os.path.join(source, 'css'))
+        self.css = b'body { color: black; }\n' * 50
+        with open(os.path.join(source, 'css', 'app.css'), 'wb') as f:
+            f.write(self.css)
+        override = override_settings(
+            STATIC_ROOT=os.path.join(directory, 'root'),
+            STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder'
+            ],
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_hashed_and_compressed(self):
+        url = static('css/app.css')
+        self.assertRegex(url, r'^/static/css/app\.[0-9a-f]{12}\.css$')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(body), self.css)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+        response = self.client.get('/static/css/app.css')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_uncollected_name(self):
+        self.assertEqual(static('img/missing.png'), '/static/img/missing.png')
+        self.assertTrue(staticfiles_storage.exists('css/app.css.gz'))
+
+
+class CompressionTest(SimpleTestCase):
+    html = b'<div class="card">post</div>\n' * 100
+
+    def respond(self, response, encoding='gzip, deflate'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_compressed(self):
+        response = HttpResponse(self.html)
+        response['ETag'] = '"a"'
+        response = self.respond(response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"a"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), self.html)
+        self.assertEqual(
+            int(response['Content-Length']), len(response.content)
+        )
+
+    def test_passed_through(self):
+        for response, encoding in (
+            (HttpResponse(self.html), 'identity'),
+            (HttpResponse(self.html[:100]), 'gzip'),
+            (HttpResponse(self.html, content_type='image/png'), 'gzip'),
+            (HttpResponse(self.html, status=404), 'gzip'),
+        ):
+            with self.subTest(response=response, encoding=encoding):
+                content = response.content
+                response = self.respond(response, encoding)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, content)
+
+    def test_streaming(self):
+        chunks = [self.html] * 10
+        response = self.respond(StreamingHttpResponse(iter(chunks)))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        body = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(body), b''.join(chunks))
+
+    def test_stitch(self):
+        parts = [self.html, b'<a>user</a>', self.html, b'', b'tail']
+        deflated = [
+            compression.deflate(part) if i % 2 == 0 else None
+            for i, part in enumerate(parts)
+        ]
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = decompressor.decompress(compression.stitch(parts, deflated))
+        self.assertEqual(body, b''.join(parts))
+        self.assertTrue(decompressor.eof)
+        self.assertEqual(decompressor.unused_data, b'')
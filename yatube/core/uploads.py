@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class OversizedUpload(SimpleUploadedFile):
+    """An upload cut off at UPLOAD_MAX_BYTES, size is what was sent"""
+
+    def __init__(self, name, content_type, size):
+        super().__init__(name, b'', content_type)
+        self.size = size
+
+
+class CappedUploadHandler(FileUploadHandler):
+    """Stop storing an upload once it passes UPLOAD_MAX_BYTES.
+
+    The handlers after this one never see the rest of an oversized file,
+    so it takes no more memory or disk than the limit. It arrives as an
+    empty OversizedUpload for form validation to reject.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_BYTES:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received > settings.UPLOAD_MAX_BYTES:
+            return OversizedUpload(
+                self.file_name, self.content_type, self.received
+            )
+        return None
@@ -0,0 +1,277 @@
+import math
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response, patch_response_headers, quote_etag
+)
+
+from core import compression, holes
+
+from .models import Post
+
+OUTCOMES = ('hit', 'stale', 'miss')
+# seconds between two looks at a page another request is rendering
+WAIT_STEP = 0.05
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+_counts_flushed = 0
+
+
+def feed_version_key(feed, key=None):
+    """Cache key of a feed version: global, group slug or author name"""
+    if key is None:
+        return f'feed_version:{feed}'
+    return f'feed_version:{feed}:{key}'
+
+
+def feed_versions(keys):
+    """Current versions, a lost key restarts from the clock"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_feed_versions(keys):
+    """Retire every cached page of the given feeds"""
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+
+
+def _flush_counts():
+    global _counts_flushed
+    with _counts_lock:
+        counts = dict(_counts)
+        _counts.clear()
+        _counts_flushed = time.monotonic()
+    for outcome, count in counts.items():
+        key = f'feed_page_metric:{outcome}'
+        if not cache.add(key, count, None):
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                pass
+
+
+def record(outcome):
+    """Count a page cache outcome, one of OUTCOMES.
+
+    Counted in the process, the shared totals are written once per
+    FEED_PAGE_METRICS_INTERVAL instead of on every request.
+    """
+    with _counts_lock:
+        _counts[outcome] += 1
+        due = (
+            time.monotonic() - _counts_flushed
+            >= settings.FEED_PAGE_METRICS_INTERVAL
+        )
+    if due:
+        _flush_counts()
+
+
+def cache_metrics():
+    """Page cache outcomes counted so far"""
+    _flush_counts()
+    keys = [f'feed_page_metric:{outcome}' for outcome in OUTCOMES]
+    found = cache.get_many(keys)
+    return {
+        outcome: found.get(key, 0) for outcome, key in zip(OUTCOMES, keys)
+    }
+
+
+def _stale(page, versions):
+    return page['versions'] != versions or time.time() >= page['expires']
+
+
+def _refresh_early(page):
+    """Whether a fresh page is picked for an early refresh.
+
+    The probability grows as its expiry nears, sooner for pages that are
+    slow to render, so a busy page is rebuilt by one request before all
+    of them miss it at once.
+    """
+    early = settings.FEED_PAGE_CACHE_BETA * page['delta'] * -math.log(
+        1.0 - random.random()
+    )
+    return time.time() + early >= page['expires']
+
+
+def _etag(request, versions):
+    """Validator of a versioned page, the holes differ between users"""
+    return quote_etag(md5('{}:{}'.format(
+        '.'.join(map(str, versions)), request.user.pk
+    ).encode()).hexdigest())
+
+
+def _wait(key):
+    """The page another request is rendering, None if it takes too long"""
+    deadline = time.monotonic() + settings.FEED_PAGE_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        page = cache.get(key)
+        if page is not None:
+            return page
+    return None
+
+
+def _lookup(key, versions):
+    """Cached page, outcome and whether the request holds the lock.
+
+    One request renders a missing or expired page. The others serve the
+    expired page meanwhile, or wait for the first rendering of a page.
+    """
+    page = cache.get(key)
+    stale = page is None or _stale(page, versions)
+    if not stale and not _refresh_early(page):
+        return page, 'hit', False
+    if cache.add(f'{key}:lock', True, settings.FEED_PAGE_CACHE_LOCK_TIMEOUT):
+        return page, 'miss', True
+    if page is None:
+        page = _wait(key)
+        if page is None:
+            return None, 'miss', False
+        stale = _stale(page, versions)
+    return page, 'stale' if stale else 'hit', False
+
+
+def _deflated(response, content):
+    """Deflated parts of a page between its holes, None for the holes"""
+    if not compression.compressible(response) or (
+        len(response.content) < settings.COMPRESSION_MIN_SIZE
+    ):
+        return None
+    return [
+        None if i % 2 else compression.deflate(part.encode(response.charset))
+        for i, part in enumerate(holes.split(content))
+    ]
+
+
+def _render(view, request, args, kwargs, key, versions, fresh_for):
+    """Render a page with holes and cache it when it is a 200"""
+    started = time.time()
+    with holes.punched(request):
+        response = view(request, *args, **kwargs)
+    content = response.content.decode(response.charset)
+    deflated = _deflated(response, content)
+    if response.status_code == 200:
+        cache.set(key, {
+            'content': content,
+            'content_type': response['Content-Type'],
+            'deflated': deflated,
+            'versions': versions,
+            'delta': time.time() - started,
+            'expires': time.time() + fresh_for,
+        }, fresh_for + settings.FEED_PAGE_STALE_TIMEOUT)
+    return response, content, deflated
+
+
+def _fill(request, response, content, deflated):
+    """Fill the holes, gzipped from the deflated parts when wanted"""
+    parts = [
+        (holes.render(part, request) if i % 2 else part).encode(
+            response.charset
+        )
+        for i, part in enumerate(holes.split(content))
+    ]
+    if deflated and compression.wanted(request, response):
+        response.content = compression.stitch(parts, deflated)
+        compression.mark(response)
+    else:
+        response.content = b''.join(parts)
+
+
+def cache_feed(feeds):
+    """Cache a feed page until it expires or one of its feeds changes.
+
+    feeds maps the view arguments to version keys. Versioned pages carry
+    an ETag from the feed versions and the user, conditional requests are
+    answered with 304 before the page is looked up. They have no
+    Last-Modified, no date tells edits, deletes or another user apart.
+    The page is rendered once for everybody with the per-user parts left
+    as holes, which are filled for each request. With FEED_PAGE_CACHE =
+    'ttl' versions are ignored and pages expire after FEED_PAGE_CACHE_TTL
+    seconds.
+
+    Expired pages are kept FEED_PAGE_STALE_TIMEOUT seconds longer and
+    served stale while the one request holding the lock rebuilds them.
+    A page missing altogether is rendered by one request too, the others
+    wait up to FEED_PAGE_CACHE_WAIT seconds for it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versioned = settings.FEED_PAGE_CACHE != 'ttl'
+            if versioned:
+                versions = feed_versions(feeds(*args, **kwargs))
+                fresh_for = settings.FEED_PAGE_CACHE_TIMEOUT
+                etag = _etag(request, versions)
+                response = get_conditional_response(request, etag=etag)
+                if response is not None:
+                    response['ETag'] = etag
+                    return response
+            else:
+                versions = []
+                fresh_for = settings.FEED_PAGE_CACHE_TTL
+            key = 'feed_page:{}'.format(
+                md5(request.get_full_path().encode()).hexdigest()
+            )
+            page, outcome, locked = _lookup(key, versions)
+            if outcome == 'miss':
+                try:
+                    response, content, deflated = _render(
+                        view, request, args, kwargs, key, versions, fresh_for
+                    )
+                finally:
+                    if locked:
+                        cache.delete(f'{key}:lock')
+            else:
+                content = page['content']
+                deflated = page.get('deflated')
+                response = HttpResponse(content_type=page['content_type'])
+            response['X-Cache'] = outcome.upper()
+            if versioned and response.status_code == 200:
+                if outcome == 'stale':
+                    # valid for the versions the page was built with
+                    etag = _etag(request, page['versions'])
+                response['ETag'] = etag
+            _fill(request, response, content, deflated)
+            record(outcome)
+            # the server copy lives long, browsers must come back for it
+            patch_response_headers(response, cache_timeout=0)
+            return response
+        return wrapper
+    return decorator
+
+
+def post_etag(request, post_id):
+    """Validator of a post page: last edit, variants and comments of a post.
+
+    The page differs between users, it has no Last-Modified for the same
+    reason as the feeds.
+    """
+    row = Post.objects.filter(pk=post_id).values(
+        'updated', 'image_variants', 'comments_count',
+        'author__stats__posts_count'
+    ).annotate(last_comment=Max('comments__created')).first()
+    if row is not None:
+        return md5('{}:{}'.format(
+            ':'.join(str(row[field]) for field in sorted(row)),
+            request.user.pk
+        ).encode()).hexdigest()
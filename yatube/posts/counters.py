@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import timeline
+from .models import Comment, Follow, Post, User, UserStats
+
+BATCH_SIZE = 500
+
+
+def _count_by(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def _user_totals():
+    return User.objects.annotate(
+        posts_total=_count_by(Post, 'author'),
+        followers_total=_count_by(Follow, 'author'),
+        following_total=_count_by(Follow, 'user'),
+    )
+
+
+def recount(user_id):
+    """Counters of one user computed from scratch"""
+    totals = _user_totals().get(pk=user_id)
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            'posts_count': totals.posts_total,
+            'followers_count': totals.followers_total,
+            'following_count': totals.following_total,
+        }
+    )
+    return stats
+
+
+def stats_for(user):
+    """Counters of a user, created on first use"""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return recount(user.pk)
+
+
+def bump_user(user_id, field, delta):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta}
+    )
+    # a missing row is only created on increments, decrements may come
+    # from the cascade that is deleting the user itself
+    if not updated and delta > 0:
+        recount(user_id)
+
+
+def bump_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta
+    )
+
+
+def _pulled(followers_count):
+    return followers_count > settings.FEED_FANOUT_THRESHOLD
+
+
+def reconcile():
+    """Fix drifted counters in bulk, returns the number of rows fixed.
+
+    Authors whose fixed follower count crosses FEED_FANOUT_THRESHOLD have
+    their followers' timelines settled, as a follow or unfollow would.
+    """
+    fixed = 0
+    crossed = []
+    with transaction.atomic():
+        stats = UserStats.objects.in_bulk()
+        missing = []
+        drifted = []
+        for user in _user_totals().iterator():
+            real = {
+                'posts_count': user.posts_total,
+                'followers_count': user.followers_total,
+                'following_count': user.following_total,
+            }
+            row = stats.get(user.pk)
+            if row is None:
+                missing.append(UserStats(user_id=user.pk, **real))
+            elif any(getattr(row, k) != v for k, v in real.items()):
+                if _pulled(row.followers_count) != _pulled(
+                    user.followers_total
+                ):
+                    crossed.append(user.pk)
+                for field, value in real.items():
+                    setattr(row, field, value)
+                drifted.append(row)
+        UserStats.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+        UserStats.objects.bulk_update(drifted, [
+            'posts_count', 'followers_count', 'following_count'
+        ], batch_size=BATCH_SIZE)
+        fixed += len(missing) + len(drifted)
+        posts = Post.objects.annotate(
+            real=_count_by(Comment, 'post')
+        ).exclude(comments_count=F('real')).only('pk')
+        drifted = []
+        for post in posts.iterator():
+            post.comments_count = post.real
+            drifted.append(post)
+        Post.objects.bulk_update(
+            drifted, ['comments_count'], batch_size=BATCH_SIZE
+        )
+        fixed += len(drifted)
+    for author_id in crossed:
+        timeline.settle(author_id)
+    return fixed
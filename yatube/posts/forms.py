@@ -1,5 +1,10 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
 
+from .images import normalize
 from .models import Post, Comment
 
 
@@ -22,6 +27,38 @@ class PostForm(forms.ModelForm):
             'image': 'Картинка',
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the field would read an oversized upload whole to verify it,
+        # it is held back and reported by clean_image instead
+        name = self.add_prefix('image')
+        upload = self.files.get(name)
+        self.oversized = (
+            upload is not None and upload.size > settings.UPLOAD_MAX_BYTES
+        )
+        if self.oversized:
+            self.files = self.files.copy()
+            self.files.pop(name)
+
+    def clean_image(self):
+        if self.oversized:
+            raise forms.ValidationError(
+                'Файл больше %(limit)s.',
+                code='too_large',
+                params={'limit': filesizeformat(settings.UPLOAD_MAX_BYTES)},
+            )
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            # the field only checks the header, a broken body fails here
+            try:
+                return normalize(image)
+            except (OSError, SyntaxError, Image.DecompressionBombError):
+                raise forms.ValidationError(
+                    self.fields['image'].error_messages['invalid_image'],
+                    code='invalid_image',
+                )
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
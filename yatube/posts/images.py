@@ -0,0 +1,72 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+# formats an upload is stored in, others are converted to JPEG or PNG
+SAVE_OPTIONS = {
+    'JPEG': lambda quality: {
+        'quality': quality, 'optimize': True, 'progressive': True
+    },
+    'WEBP': lambda quality: {'quality': quality, 'method': 6},
+    'PNG': lambda quality: {'optimize': True},
+    'GIF': lambda quality: {'optimize': True},
+}
+
+EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png', 'GIF': '.gif'}
+
+
+def _target_format(image, source_format):
+    if source_format in SAVE_OPTIONS:
+        return source_format
+    if image.mode in ('RGBA', 'LA', 'P'):
+        return 'PNG'
+    return 'JPEG'
+
+
+def normalize(upload):
+    """The upload decoded once, fitted into IMAGE_MAX_SIZE and re-encoded.
+
+    EXIF, XMP and comments are dropped after the orientation they carry
+    is applied, the colour profile is kept. Animations are stored as they
+    came. A small image without metadata keeps its bytes when encoding
+    it again would not make it smaller.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload
+    source_format = image.format
+    limit = settings.IMAGE_MAX_SIZE
+    # JPEG decodes straight to a 1/2 to 1/8 scale at least as large
+    image.draft('RGB', (limit, limit))
+    metadata = any(
+        key in image.info for key in ('exif', 'xmp', 'comment')
+    ) or bool(image.getexif())
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+    resized = max(image.size) > limit
+    if resized:
+        image.thumbnail((limit, limit), Image.LANCZOS)
+    target = _target_format(image, source_format)
+    if target == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    options = SAVE_OPTIONS[target](settings.IMAGE_QUALITY)
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    image.save(buffer, target, **options)
+    if not (resized or metadata or target != source_format) and (
+        buffer.tell() >= upload.size
+    ):
+        upload.seek(0)
+        return upload
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return SimpleUploadedFile(
+        name + EXTENSIONS[target],
+        buffer.getvalue(),
+        Image.MIME[target]
+    )
@@ -0,0 +1,48 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.utils import POSTS_PER_PAGE
+
+
+class Command(BaseCommand):
+    help = 'Compare CPU time and memory per feed page: models against rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=200)
+        parser.add_argument('--per-page', type=int, default=POSTS_PER_PAGE)
+
+    def measure(self, queryset, pages, per_page):
+        page = slice(0, per_page)
+        tracemalloc.start()
+        started = time.process_time()
+        for _ in range(pages):
+            posts = list(queryset[page])
+            for post in posts:
+                # what a post card reads
+                (post.pk, post.card_version, post.text, post.pub_date,
+                 post.image, post.author.get_full_name(),
+                 post.author.username, post.group and post.group.slug)
+        cpu = (time.process_time() - started) / pages
+        # memory held by one materialised page
+        tracemalloc.reset_peak()
+        snapshot = tracemalloc.get_traced_memory()[0]
+        posts = list(queryset[page])
+        size = tracemalloc.get_traced_memory()[0] - snapshot
+        tracemalloc.stop()
+        return len(posts), cpu, size
+
+    def handle(self, *args, **options):
+        for name, queryset in (
+            ('models', Post.objects.feed()),
+            ('rows', Post.objects.rows()),
+        ):
+            count, cpu, size = self.measure(
+                queryset, options['pages'], options['per_page']
+            )
+            self.stdout.write(
+                f'{name}: {count} posts, {cpu * 1000:.2f} ms/page, '
+                f'{size / 1024:.1f} KiB/page'
+            )
@@ -0,0 +1,72 @@
+import time
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageFilter
+from sorl.thumbnail import delete
+
+from posts import thumbnails
+from posts.images import normalize
+
+
+class Command(BaseCommand):
+    help = ('Compare a phone photo stored as uploaded against the '
+            'normalized one: bytes stored and time to make its thumbnails')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument('--width', type=int, default=4032)
+        parser.add_argument('--height', type=int, default=3024)
+
+    def photo(self, width, height):
+        # smooth shapes with sensor noise over them
+        image = Image.merge('RGB', [
+            Image.blend(
+                Image.effect_mandelbrot(
+                    (width, height), (-2.2, -1.2, 0.8, 1.2), 64 * band
+                ).filter(ImageFilter.GaussianBlur(2)),
+                Image.effect_noise((width, height), 32),
+                0.15
+            )
+            for band in (1, 2, 4)
+        ])
+        exif = Image.Exif()
+        exif[0x010f] = 'Phone'
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=95, exif=exif.tobytes())
+        return SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg'
+        )
+
+    def thumbnail_time(self, upload, rounds):
+        elapsed = 0
+        for _ in range(rounds):
+            # a new name every round, made thumbnails are never reused
+            upload.seek(0)
+            name = default_storage.save(
+                f'benchmark/{time.time_ns()}-{upload.name}', upload
+            )
+            started = time.perf_counter()
+            thumbnails.make(name)
+            elapsed += time.perf_counter() - started
+            delete(name)
+        return elapsed / rounds
+
+    def handle(self, *args, **options):
+        upload = self.photo(options['width'], options['height'])
+        started = time.perf_counter()
+        normalized = normalize(upload)
+        ingest = time.perf_counter() - started
+        for label, image in (('uploaded', upload), ('normalized', normalized)):
+            elapsed = self.thumbnail_time(image, options['rounds'])
+            self.stdout.write(
+                f'{label}: {image.size / 1024:.0f} kB, '
+                f'{len(thumbnails.SIZES)} thumbnails in '
+                f'{elapsed * 1000:.0f} ms'
+            )
+        saved = 1 - normalized.size / upload.size
+        self.stdout.write(
+            f'normalizing took {ingest * 1000:.0f} ms, saved {saved:.0%}'
+        )
@@ -0,0 +1,64 @@
+import time
+from contextlib import nullcontext
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from sorl.thumbnail import default
+
+from posts import thumbnails
+from posts.models import Post
+from posts.utils import POSTS_PER_PAGE
+
+
+class Command(BaseCommand):
+    help = ('Compare thumbnail lookups of an index page: one per tag '
+            'against one batched prefetch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=100)
+
+    def lookup(self, posts, batched):
+        block = thumbnails.prefetch(posts) if batched else nullcontext()
+        with block:
+            geometry, options = thumbnails.CARD
+            for post in posts:
+                default.backend.get_thumbnail(post.image, geometry, **options)
+
+    def measure(self, posts, pages, batched, cold):
+        queries = 0
+        elapsed = 0
+        for _ in range(pages):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                self.lookup(posts, batched)
+                elapsed += time.perf_counter() - started
+            queries += len(captured)
+        return queries / pages, elapsed / pages
+
+    def handle(self, *args, **options):
+        posts = list(
+            Post.objects.exclude(image='').filter(
+                image_variants=''
+            ).rows()[:POSTS_PER_PAGE]
+        )
+        if not posts:
+            self.stderr.write('No posts with images to look up')
+            return
+        # made up front so that every lookup finds its thumbnail
+        with override_settings(THUMBNAIL_WORKERS=0):
+            for post in posts:
+                thumbnails.queue(post.image, [thumbnails.CARD])
+        for cold in (True, False):
+            for batched in (False, True):
+                queries, elapsed = self.measure(
+                    posts, options['pages'], batched, cold
+                )
+                self.stdout.write(
+                    f'{"cold" if cold else "warm"} cache, '
+                    f'{"prefetch" if batched else "per tag"}: '
+                    f'{queries:.1f} queries, {elapsed * 1000:.2f} ms/page'
+                )
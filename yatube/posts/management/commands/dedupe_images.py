@@ -0,0 +1,50 @@
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+HASHED = re.compile(r'[0-9a-f]{64}')
+
+
+class Command(BaseCommand):
+    help = ('Move post images saved before content addressing to their '
+            'hash names, one file per distinct content')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).distinct()
+        # read up front, the loop renames the images it reads
+        legacy = [
+            name for name in names
+            if not HASHED.fullmatch(
+                posixpath.splitext(posixpath.basename(name))[0]
+            )
+        ]
+        moved = set()
+        freed = 0
+        for name in legacy:
+            if not storage.exists(name):
+                self.stderr.write(f'{name}: missing')
+                continue
+            with storage.open(name) as content:
+                content = File(content, name)
+                hashed = storage.hashed_name(name, content)
+                if storage.exists(hashed):
+                    freed += content.size
+                storage.save(name, content)
+            Post.objects.filter(image=name).update(
+                image=hashed, image_variants=''
+            )
+            thumbnails.release(name)
+            moved.add(hashed)
+            thumbnails.queue(hashed)
+        self.stdout.write(
+            f'{len(legacy)} images stored as {len(moved)} files, '
+            f'{freed / 1024:.0f} kB freed'
+        )
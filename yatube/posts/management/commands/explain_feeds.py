@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.timeline import FollowFeed
+from posts.utils import POSTS_PER_PAGE
+
+
+def _sample(model):
+    return model.objects.order_by('pk').first() or model(pk=0)
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN QUERY PLAN for the queries of every feed view'
+
+    def queries(self):
+        group = _sample(Group)
+        user = _sample(User)
+        post = _sample(Post)
+        page = slice(0, POSTS_PER_PAGE)
+        follow = FollowFeed(user)
+        follow.pulled = follow.pulled or [user.pk]
+        return {
+            'index': Post.objects.feed()[page],
+            'group_posts': Post.objects.filter(group=group).feed()[page],
+            'profile': Post.objects.filter(author=user).feed()[page],
+            'profile following': Follow.objects.filter(
+                user=user, author=user
+            ).values('pk')[:1],
+            'post_detail comments': Comment.objects.filter(
+                post=post
+            ).order_by('created'),
+            'follow_index pushed': follow.pushed()[page],
+            'follow_index pulled': follow.pulled_posts()[page],
+        }
+
+    def handle(self, *args, **options):
+        for view, queryset in self.queries().items():
+            plan = queryset.explain()
+            uses_index = 'USING INDEX' in plan or 'USING COVERING' in plan
+            sorts = 'TEMP B-TREE' in plan
+            style = self.style.SUCCESS
+            if not uses_index or sorts:
+                style = self.style.WARNING
+            self.stdout.write(style(
+                f'{view}: index={"yes" if uses_index else "no"} '
+                f'sort={"yes" if sorts else "no"}'
+            ))
+            self.stdout.write(plan)
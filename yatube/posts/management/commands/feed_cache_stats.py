@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import cache_metrics
+
+
+class Command(BaseCommand):
+    help = 'Print hit, stale and miss counts of the feed page cache'
+
+    def handle(self, *args, **options):
+        metrics = cache_metrics()
+        total = sum(metrics.values())
+        for outcome, count in metrics.items():
+            share = count / total * 100 if total else 0
+            self.stdout.write(f'{outcome}: {count} ({share:.1f}%)')
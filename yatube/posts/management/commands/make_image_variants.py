@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Make the responsive variants of post images that lack them'
+
+    def handle(self, *args, **options):
+        # read up front, making the variants writes to the same rows
+        names = list(Post.objects.exclude(image='').filter(
+            image_variants=''
+        ).values_list('image', flat=True).distinct())
+        made = 0
+        for name in names:
+            try:
+                thumbnails.make(name)
+            except Exception as error:
+                self.stderr.write(f'{name}: {error}')
+                continue
+            made += 1
+        self.stdout.write(f'Made the variants of {made} images')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every follow timeline from Follow and Post tables'
+
+    def handle(self, *args, **options):
+        rows = timeline.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f'Timelines rebuilt: {rows} rows')
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Recount post, comment and follow counters and fix any drift'
+
+    def handle(self, *args, **options):
+        fixed = counters.reconcile()
+        self.stdout.write(
+            self.style.SUCCESS(f'Counters reconciled: {fixed} rows fixed')
+        )
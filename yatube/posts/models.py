@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import ContentAddressedStorage
+
+from .rows import FIELDS, FeedRowIterable
+
 User = get_user_model()
 
 
@@ -13,11 +17,39 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Newest first, with only the columns the post cards read"""
+        return self.select_related('author', 'group').only(
+            'text',
+            'pub_date',
+            'updated',
+            'image',
+            'image_variants',
+            'author',
+            'author__username',
+            'author__first_name',
+            'author__last_name',
+            'group',
+            'group__slug',
+            'group__title',
+        ).order_by('-pub_date', '-pk')
+
+    def rows(self):
+        """The feed as lean FeedRow objects built from values_list()"""
+        queryset = self.order_by('-pub_date', '-pk').values_list(*FIELDS)
+        queryset._iterable_class = FeedRowIterable
+        return queryset
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField(
         auto_now_add=True,
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -29,10 +61,58 @@ class Post(models.Model):
         blank=True,
         null=True,
         related_name='posts')
+    # stored once per content, the posts referring to a file count it
     image = models.ImageField(
         upload_to='posts/',
-        blank=True
+        blank=True,
+        storage=ContentAddressedStorage(),
+        db_index=True
+    )
+    # JSON list of the thumbnails.SIZES made of image, empty until ready
+    image_variants = models.TextField(
+        blank=True,
+        editable=False
     )
+    comments_count = models.IntegerField(
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    @property
+    def card_version(self):
+        """Changes on every save, part of the post card fragment key"""
+        return int(self.updated.timestamp() * 1000000)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        # remembered to move feed totals when an edit changes the group,
+        # to drop the card fragment of the replaced version and to release
+        # a replaced image
+        post.loaded_group_id = post.__dict__.get('group_id')
+        post.loaded_image = post.__dict__.get('image')
+        post.loaded_card_version = None
+        if post.__dict__.get('updated') is not None:
+            post.loaded_card_version = post.card_version
+        return post
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -54,6 +134,14 @@ class Comment(models.Model):
         auto_now_add=True,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -67,5 +155,62 @@ class Follow(models.Model):
         related_name='following'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
+        ]
+
     def __str__(self):
         return f'{self.user}+{self.author}'
+
+
+class UserStats(models.Model):
+    """Counters kept in step with posts and follows of a user"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user} stats'
+
+
+class Timeline(models.Model):
+    """Materialized follow feed: one row per post pushed to a follower"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    # copied from the post, pages are read from the index alone
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}<-{self.post_id}'
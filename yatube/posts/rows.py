@@ -0,0 +1,102 @@
+from django.db.models.query import ValuesListIterable
+
+FIELDS = (
+    'pk',
+    'text',
+    'pub_date',
+    'updated',
+    'image',
+    'image_variants',
+    'author_id',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group_id',
+    'group__slug',
+    'group__title',
+)
+
+
+class FeedAuthor:
+    __slots__ = ('pk', 'username', 'first_name', 'last_name')
+
+    def __init__(self, pk, username, first_name, last_name):
+        self.pk = pk
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+    def get_full_name(self):
+        return f'{self.first_name} {self.last_name}'.strip()
+
+    def __str__(self):
+        return self.username
+
+
+class FeedGroup:
+    __slots__ = ('pk', 'slug', 'title')
+
+    def __init__(self, pk, slug, title):
+        self.pk = pk
+        self.slug = slug
+        self.title = title
+
+    def __str__(self):
+        return self.title
+
+
+class FeedRow:
+    """Post card data without a model instance behind it"""
+    __slots__ = (
+        'pk', 'text', 'pub_date', 'updated', 'image', 'image_variants',
+        'author', 'group'
+    )
+
+    def __init__(self, pk, text, pub_date, updated, image, image_variants,
+                 author, group):
+        self.pk = pk
+        self.text = text
+        self.pub_date = pub_date
+        self.updated = updated
+        self.image = image
+        self.image_variants = image_variants
+        self.author = author
+        self.group = group
+
+    @property
+    def id(self):
+        return self.pk
+
+    @property
+    def card_version(self):
+        return int(self.updated.timestamp() * 1000000)
+
+    def __str__(self):
+        return self.text[:15]
+
+
+class FeedRowIterable(ValuesListIterable):
+    """FeedRow per row of FIELDS, authors and groups shared within a page"""
+
+    def __iter__(self):
+        authors = {}
+        groups = {}
+        for row in super().__iter__():
+            (pk, text, pub_date, updated, image, image_variants, author_id,
+             username, first_name, last_name, group_id, slug, title) = row
+            author = authors.get(author_id)
+            if author is None:
+                author = authors[author_id] = FeedAuthor(
+                    author_id, username, first_name, last_name
+                )
+            group = None
+            if group_id is not None:
+                group = groups.get(group_id)
+                if group is None:
+                    group = groups[group_id] = FeedGroup(
+                        group_id, slug, title
+                    )
+            yield FeedRow(
+                pk, text, pub_date, updated, image, image_variants, author,
+                group
+            )
@@ -0,0 +1,243 @@
+import json
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import counters, thumbnails, timeline
+from .caching import bump_feed_versions, feed_version_key
+from .models import Comment, Follow, Group, Post, User
+from .utils import feed_count_key, incr_feed_counts
+
+
+def card_key(post, version):
+    """Fragment key of includes/post_card.html for a version of post"""
+    group = post.group
+    return make_template_fragment_key('post_card', [
+        post.pk, version, post.author.username, post.author.get_full_name(),
+        group.slug if group is not None else '', post.image_variants,
+    ])
+
+
+def _drop_card(post, version):
+    # a fragment keyed by names since renamed is unreachable already and
+    # left to expire
+    if version is not None:
+        cache.delete(card_key(post, version))
+
+
+def _feed_count_keys(post):
+    keys = [
+        feed_count_key('global'),
+        feed_count_key('author', post.author_id),
+    ]
+    if post.group_id is not None:
+        keys.append(feed_count_key('group', post.group_id))
+    return keys
+
+
+def _bump_feeds(post, loaded_group_id=None):
+    keys = [
+        feed_version_key('global'),
+        feed_version_key('author', post.author.username),
+    ]
+    if post.group_id is not None:
+        keys.append(feed_version_key('group', post.group.slug))
+    if loaded_group_id not in (None, post.group_id):
+        slug = Group.objects.filter(pk=loaded_group_id).values_list(
+            'slug', flat=True
+        ).first()
+        if slug is not None:
+            keys.append(feed_version_key('group', slug))
+    bump_feed_versions(keys)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    # the field file holds the upload until it is stored, not after
+    instance.saving_image = instance.image
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, 'posts_count', 1)
+        incr_feed_counts(_feed_count_keys(instance), 1)
+        timeline.fan_out(instance)
+        _bump_feeds(instance)
+        if instance.image:
+            transaction.on_commit(
+                partial(thumbnails.retain, instance.saving_image)
+            )
+        instance.loaded_image = instance.image.name
+        instance.loaded_group_id = instance.group_id
+        return
+    _drop_card(instance, getattr(instance, 'loaded_card_version', None))
+    instance.loaded_card_version = instance.card_version
+    loaded_image = getattr(instance, 'loaded_image', None)
+    if instance.image and loaded_image != instance.image.name:
+        transaction.on_commit(
+            partial(thumbnails.retain, instance.saving_image)
+        )
+    if loaded_image and loaded_image != instance.image.name:
+        transaction.on_commit(partial(thumbnails.release, loaded_image))
+    instance.loaded_image = instance.image.name
+    loaded_group_id = getattr(instance, 'loaded_group_id', None)
+    _bump_feeds(instance, loaded_group_id)
+    if loaded_group_id != instance.group_id:
+        if loaded_group_id is not None:
+            incr_feed_counts([feed_count_key('group', loaded_group_id)], -1)
+        if instance.group_id is not None:
+            incr_feed_counts([feed_count_key('group', instance.group_id)], 1)
+        instance.loaded_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'posts_count', -1)
+    incr_feed_counts(_feed_count_keys(instance), -1)
+    timeline.forget_counts(instance.author_id)
+    _drop_card(instance, instance.card_version)
+    _bump_feeds(instance)
+    if instance.image:
+        transaction.on_commit(partial(thumbnails.release, instance.image.name))
+
+
+def _linking_feeds(posts):
+    """Version keys of the global feed and of the authors of posts"""
+    usernames = posts.values_list('author__username', flat=True).distinct()
+    return [feed_version_key('global')] + [
+        feed_version_key('author', username) for username in usernames
+    ]
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, **kwargs):
+    instance.loaded_slug = None
+    if instance.pk is not None:
+        instance.loaded_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    keys = [feed_version_key('group', instance.slug)]
+    loaded_slug = getattr(instance, 'loaded_slug', None)
+    if loaded_slug not in (None, instance.slug):
+        # the old address must stop answering and cards link to the new one
+        keys.append(feed_version_key('group', loaded_slug))
+        keys.extend(_linking_feeds(instance.posts.all()))
+    bump_feed_versions(keys)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # the posts are moved out of the group before post_delete
+    instance.loaded_feeds = _linking_feeds(instance.posts.all())
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    bump_feed_versions(
+        [feed_version_key('group', instance.slug)]
+        + getattr(instance, 'loaded_feeds', [])
+    )
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    instance.loaded_names = None
+    # a login saves last_login alone, names are not read for it
+    if instance.pk is None or update_fields is not None and not {
+        'username', 'first_name', 'last_name'
+    }.intersection(update_fields):
+        return
+    instance.loaded_names = User.objects.filter(pk=instance.pk).values_list(
+        'username', 'first_name', 'last_name'
+    ).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    loaded_names = getattr(instance, 'loaded_names', None)
+    names = (instance.username, instance.first_name, instance.last_name)
+    if created or loaded_names in (None, names):
+        return
+    # every feed with a post of the author shows the names
+    posts = instance.posts.all()
+    slugs = posts.exclude(group=None).values_list(
+        'group__slug', flat=True
+    ).distinct()
+    bump_feed_versions([
+        feed_version_key('global'),
+        feed_version_key('author', loaded_names[0]),
+        feed_version_key('author', instance.username),
+    ] + [feed_version_key('group', slug) for slug in slugs])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+
+
+def _follow_feeds(follow):
+    """Version keys of both profiles, each shows a count of follows"""
+    return [
+        feed_version_key('author', follow.author.username),
+        feed_version_key('author', follow.user.username),
+    ]
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.user_id, 'following_count', 1)
+        counters.bump_user(instance.author_id, 'followers_count', 1)
+        timeline.backfill(instance.user, instance.author)
+        cache.delete(feed_count_key('follow', instance.user_id))
+        bump_feed_versions(_follow_feeds(instance))
+        followers = timeline.followers(instance.author_id)
+        if followers == settings.FEED_FANOUT_THRESHOLD + 1:
+            timeline.settle(instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.user_id, 'following_count', -1)
+    counters.bump_user(instance.author_id, 'followers_count', -1)
+    timeline.prune(instance.user, instance.author)
+    cache.delete(feed_count_key('follow', instance.user_id))
+    bump_feed_versions(_follow_feeds(instance))
+    followers = timeline.followers(instance.author_id)
+    if followers == settings.FEED_FANOUT_THRESHOLD:
+        timeline.settle(instance.author_id)
+
+
+@receiver(thumbnails.thumbnails_ready)
+def thumbnails_made(sender, name, variants=None, **kwargs):
+    # pages rendered meanwhile show the placeholder, the variants key a new
+    # card and feed versions make them render again with the thumbnail;
+    # updated is the time of the last edit and stays
+    posts = list(Post.objects.filter(image=name).select_related(
+        'author', 'group'
+    ))
+    if variants is not None:
+        Post.objects.filter(pk__in=[post.pk for post in posts]).update(
+            image_variants=json.dumps(variants)
+        )
+    for post in posts:
+        _drop_card(post, post.card_version)
+        _bump_feeds(post)
@@ -0,0 +1,140 @@
+import json
+from hashlib import md5
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.feedgenerator import rfc2822_date, rfc3339_date
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .caching import feed_versions
+from .utils import decode_cursor, encode_position, keyset
+
+
+def _title(post):
+    return Truncator(post.text).chars(50)
+
+
+def _url(request, post):
+    return request.build_absolute_uri(
+        reverse('posts:post_detail', args=[post.pk])
+    )
+
+
+def rss(request, title, link, updated, posts):
+    yield (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<rss version="2.0"><channel>'
+        f'<title>{escape(title)}</title><link>{escape(link)}</link>'
+        f'<description>{escape(title)}</description>'
+    )
+    for post in posts:
+        url = escape(_url(request, post))
+        yield (
+            f'<item><title>{escape(_title(post))}</title>'
+            f'<link>{url}</link><guid>{url}</guid>'
+            f'<pubDate>{rfc2822_date(post.pub_date)}</pubDate>'
+            f'<description>{escape(post.text)}</description></item>'
+        )
+    yield '</channel></rss>'
+
+
+def atom(request, title, link, updated, posts):
+    yield (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom">'
+        f'<title>{escape(title)}</title><link href={quoteattr(link)}/>'
+        f'<id>{escape(link)}</id><updated>{rfc3339_date(updated)}</updated>'
+    )
+    for post in posts:
+        url = _url(request, post)
+        yield (
+            f'<entry><title>{escape(_title(post))}</title>'
+            f'<link href={quoteattr(url)}/><id>{escape(url)}</id>'
+            f'<published>{rfc3339_date(post.pub_date)}</published>'
+            f'<updated>{rfc3339_date(post.updated)}</updated>'
+            f'<author><name>{escape(post.author.username)}</name></author>'
+            f'<content type="text">{escape(post.text)}</content></entry>'
+        )
+    yield '</feed>'
+
+
+def json_feed(request, title, link, updated, posts):
+    yield json.dumps({
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': title,
+        'home_page_url': link,
+        'feed_url': request.build_absolute_uri(),
+    })[:-1] + ', "items": ['
+    separator = ''
+    for post in posts:
+        item = {
+            'id': str(post.pk),
+            'url': _url(request, post),
+            'title': _title(post),
+            'content_text': post.text,
+            'date_published': post.pub_date.isoformat(),
+            'date_modified': post.updated.isoformat(),
+            'authors': [{'name': post.author.username}],
+        }
+        if post.image:
+            item['image'] = request.build_absolute_uri(
+                settings.MEDIA_URL + post.image
+            )
+        yield separator + json.dumps(item)
+        separator = ', '
+    yield ']}'
+
+
+FORMATS = {
+    'rss': (rss, 'application/rss+xml; charset=utf-8'),
+    'atom': (atom, 'application/atom+xml; charset=utf-8'),
+    'json': (json_feed, 'application/feed+json; charset=utf-8'),
+}
+
+
+def syndicate(request, fmt, title, link, posts, version_keys):
+    """Stream a feed of posts as RSS, Atom or JSON Feed.
+
+    Up to SYNDICATION_ITEMS newest posts are written one by one from a
+    server-side iterator. ?since= takes the X-Feed-Since cursor of an
+    earlier response: the posts after it are written oldest first, up to
+    SYNDICATION_ITEMS, and X-Feed-Since points at the last one written,
+    so a poller that fell behind catches up over a few requests.
+
+    The ETag covers the feed versions, which edits and deletes move, and
+    the cursor. There is no Last-Modified, no date covers an edit.
+    """
+    if fmt not in FORMATS:
+        raise Http404
+    writer, content_type = FORMATS[fmt]
+    since = decode_cursor(request.GET.get('since'))
+    etag = quote_etag(md5('{}:{}'.format(
+        '.'.join(map(str, feed_versions(version_keys))),
+        request.GET.get('since', '') if since else '',
+    ).encode()).hexdigest())
+    position = since
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        keys = list(keyset(posts, before=since).values_list(
+            'pub_date', 'pk'
+        )[:settings.SYNDICATION_ITEMS])
+        # exactly the posts of keys, whatever is published meanwhile
+        items = posts.filter(pk__in=[pk for _, pk in keys]).rows()
+        if since is not None:
+            items = items.order_by('pub_date', 'pk')
+        if keys:
+            position = keys[-1] if since is not None else keys[0]
+        updated = max(keys)[0] if keys else timezone.now()
+        response = StreamingHttpResponse(
+            writer(request, title, request.build_absolute_uri(link),
+                   updated, items.iterator()),
+            content_type=content_type
+        )
+    response['ETag'] = etag
+    if position is not None:
+        response['X-Feed-Since'] = encode_position(*position)
+    return response
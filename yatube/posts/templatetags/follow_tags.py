@@ -0,0 +1,13 @@
+from django import template
+
+from posts.models import Follow
+
+register = template.Library()
+
+
+@register.filter
+def follows(user, username):
+    return user.is_authenticated and Follow.objects.filter(
+        user=user,
+        author__username=username
+    ).exists()
@@ -0,0 +1,10 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.filter
+def picture(variants):
+    return thumbnails.picture(variants)
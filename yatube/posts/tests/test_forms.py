@@ -1,10 +1,12 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..forms import PostForm, CommentForm
 from ..models import Group, Post
@@ -14,7 +16,7 @@ User = get_user_model()
 MEDIA_ROOT = tempfile.mkdtemp()
 
 
-@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -99,3 +101,54 @@ class PostFormTests(TestCase):
                 group=None
             ).exists()
         )
+
+    def _photo(self, size, **save):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # stored sideways, shown rotated
+        exif[0x010f] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes(), **save
+        )
+        return SimpleUploadedFile(
+            'photo.jpeg', buffer.getvalue(), content_type='image/jpeg'
+        )
+
+    @override_settings(IMAGE_MAX_SIZE=100)
+    def test_post_image_normalized(self):
+        self.auth.post(reverse('posts:post_create'), {
+            'text': 'big photo',
+            'image': self._photo((400, 200), quality=100),
+        })
+        post = Post.objects.get(text='big photo')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertFalse(image.getexif())
+
+    @override_settings(UPLOAD_MAX_BYTES=1024)
+    def test_post_image_too_large(self):
+        response = self.auth.post(reverse('posts:post_create'), {
+            'text': 'huge photo',
+            'image': self._photo((400, 400), quality=100),
+        })
+        self.assertFalse(Post.objects.filter(text='huge photo').exists())
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 1,0\xa0КБ.'
+        )
+
+    def test_post_image_truncated(self):
+        photo = self._photo((400, 400)).read()
+        response = self.auth.post(reverse('posts:post_create'), {
+            'text': 'broken photo',
+            'image': SimpleUploadedFile(
+                'photo.jpeg', photo[:len(photo) // 2],
+                content_type='image/jpeg'
+            ),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.filter(text='broken photo').exists())
+        self.assertFormError(
+            response, 'form', 'image',
+            PostForm.base_fields['image'].error_messages['invalid_image']
+        )
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -13,7 +16,7 @@ class PostModelTest(TestCase):
         cls.user = User.objects.create_user(username='auth')
         cls.group = Group.objects.create(
             title='Test grp',
-            slug='Test slug',
+            slug='test-slug',
             description='Test desc',
         )
         cls.post = Post.objects.create(
@@ -32,3 +35,39 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         self.assertEqual(str(group), group.title,
                          'check group __str__ method')
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.user1 = User.objects.create_user(username='auth1')
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(author=self.user, text='Test text')
+        Comment.objects.create(post=post, author=self.user1, text='Test')
+        follow = Follow.objects.create(user=self.user1, author=self.user)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.user1).following_count, 1
+        )
+        follow.delete()
+        post.delete()
+        stats.refresh_from_db()
+        self.assertEqual(stats.posts_count, 0)
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_reconcile_counters(self):
+        Post.objects.bulk_create(
+            Post(author=self.user, text='Test text') for _ in range(3)
+        )
+        UserStats.objects.all().delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        stats = UserStats.objects.in_bulk()
+        self.assertEqual(stats[self.user.pk].posts_count, 3)
+        self.assertEqual(stats[self.user1.pk].posts_count, 0)
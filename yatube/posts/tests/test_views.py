@@ -1,20 +1,41 @@
+import gzip
+import json
 import shutil
 import tempfile
+import threading
+from hashlib import md5
+from io import StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.core.paginator import Page
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
 
-from ..models import Group, Post, Follow, Comment
+from core import compression
+
+from .. import counters, thumbnails, timeline
+from ..caching import cache_metrics
+from ..models import Group, Post, Follow, Comment, Timeline, UserStats
+from ..signals import card_key
+from ..utils import CachedCountPaginator, encode_cursor, feed_count_key
 
 User = get_user_model()
 
 MEDIA_ROOT = tempfile.mkdtemp()
 
 
-@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostViewTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -56,6 +77,7 @@ class PostViewTest(TestCase):
         super().tearDownClass()
 
     def setUp(self):
+        cache.clear()
         self.guest = Client()
         self.auth = Client()
         self.auth.force_login(self.user)
@@ -148,6 +170,65 @@ class PostViewTest(TestCase):
         self.assertEqual(len(response.context['page_obj']), 1)
 
     def test_cache_index(self):
+        response_before = self.auth.get(reverse('posts:index')).content
+        Post.objects.filter(pk=self.post.pk).update(text='unsignalled')
+        response_after = self.auth.get(reverse('posts:index')).content
+        self.assertEqual(response_before, response_after)
+        Post.objects.create(
+            author=self.user,
+            text='test',
+        )
+        response_after = self.auth.get(reverse('posts:index')).content
+        self.assertNotEqual(response_before, response_after)
+
+    def test_cache_group_and_user_writes(self):
+        group_address = reverse('posts:group', args=[self.group.slug])
+        profile_address = reverse('posts:profile', args=[self.user.username])
+        for address in (group_address, profile_address):
+            self.guest.get(address)
+            self.assertEqual(self.guest.get(address)['X-Cache'], 'HIT')
+        self.guest.get(reverse('posts:index'))
+        author = User.objects.get(pk=self.user.pk)
+        author.username = 'renamed'
+        author.first_name = 'Renamed'
+        author.save()
+        self.assertEqual(self.guest.get(profile_address).status_code, 404)
+        self.assertContains(self.guest.get(reverse('posts:index')), 'Renamed')
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'moved'
+        group.save()
+        self.assertEqual(self.guest.get(group_address).status_code, 404)
+        moved_address = reverse('posts:group', args=['moved'])
+        self.guest.get(moved_address)
+        group.delete()
+        self.assertEqual(self.guest.get(moved_address).status_code, 404)
+
+    def test_cache_follower_profile(self):
+        address = reverse('posts:profile', args=[self.user.username])
+        self.guest.get(address)
+        response = self.guest.get(address)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertContains(response, 'подписок: 0')
+        follow = Follow.objects.create(user=self.user, author=self.user1)
+        self.assertContains(self.guest.get(address), 'подписок: 1')
+        follow.delete()
+        self.assertContains(self.guest.get(address), 'подписок: 0')
+
+    def test_cache_shared_between_users(self):
+        self.guest.get(reverse('posts:index'))
+        response = self.auth.get(reverse('posts:index'))
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        self.assertTemplateUsed(response, 'includes/header.html')
+        self.assertContains(response, f'Пользователь: {self.user.username}')
+        self.assertNotContains(response, '<!--hole')
+        Follow.objects.create(user=self.user, author=self.user1)
+        address = reverse('posts:profile', args=[self.user1.username])
+        self.assertContains(self.guest.get(address), 'Подписаться')
+        self.assertContains(self.auth.get(address), 'Отписаться')
+
+    @override_settings(FEED_PAGE_CACHE='ttl')
+    def test_cache_index_ttl(self):
+        cache.clear()
         response_before = self.auth.get(reverse('posts:index')).content
         Post.objects.create(
             author=self.user,
@@ -156,6 +237,334 @@ class PostViewTest(TestCase):
         response_after = self.auth.get(reverse('posts:index')).content
         self.assertEqual(response_before, response_after)
 
+    def test_cache_stale_while_revalidate(self):
+        before = cache_metrics()
+        address = reverse('posts:index')
+        response_before = self.auth.get(address)
+        self.assertEqual(response_before['X-Cache'], 'MISS')
+        self.assertEqual(self.auth.get(address)['X-Cache'], 'HIT')
+        Post.objects.create(author=self.user, text='test')
+        lock = 'feed_page:{}:lock'.format(md5(address.encode()).hexdigest())
+        cache.add(lock, True)
+        response = self.auth.get(address)
+        self.assertEqual(response['X-Cache'], 'STALE')
+        self.assertEqual(response.content, response_before.content)
+        cache.delete(lock)
+        response = self.auth.get(address)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotEqual(response.content, response_before.content)
+        after = cache_metrics()
+        self.assertEqual(
+            {outcome: after[outcome] - before[outcome] for outcome in after},
+            {'hit': 1, 'stale': 1, 'miss': 2}
+        )
+
+    @override_settings(FEED_PAGE_CACHE_WAIT=1)
+    def test_cache_cold_miss_waits(self):
+        address = reverse('posts:index')
+        self.auth.get(address)
+        key = 'feed_page:{}'.format(md5(address.encode()).hexdigest())
+        page = cache.get(key)
+        cache.delete(key)
+        cache.add(f'{key}:lock', True)
+        # the request holding the lock stores the page meanwhile
+        renderer = threading.Timer(0.1, lambda: cache.set(key, page, None))
+        renderer.start()
+        response = self.auth.get(address)
+        renderer.join()
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_cache_early_refresh_lost_lock(self):
+        address = reverse('posts:index')
+        self.auth.get(address)
+        key = 'feed_page:{}'.format(md5(address.encode()).hexdigest())
+        cache.add(f'{key}:lock', True)
+        with mock.patch('posts.caching._refresh_early', return_value=True):
+            response = self.auth.get(address)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_cache_gzip(self):
+        address = reverse('posts:index')
+        plain = self.auth.get(address).content
+        with mock.patch(
+            'core.compression.deflate', wraps=compression.deflate
+        ) as deflate:
+            response = self.auth.get(address, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain)
+        # only the header and switcher holes are compressed on a hit
+        self.assertEqual(deflate.call_count, 2)
+
+    def test_conditional_get(self):
+        for address, queries in (
+            (reverse('posts:index'), 2),
+            (reverse('posts:group', args=[self.group.slug]), 2),
+            (reverse('posts:profile', args=[self.user.username]), 2),
+            (reverse('posts:post_detail', args=[self.post.pk]), 3),
+        ):
+            with self.subTest(address=address):
+                response = self.auth.get(address)
+                etag = response['ETag']
+                self.assertFalse(response.has_header('Last-Modified'))
+                with self.assertNumQueries(queries):
+                    response = self.auth.get(
+                        address, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                # a date alone cannot tell whose page it was or an edit
+                response = self.auth.get(
+                    address, HTTP_IF_MODIFIED_SINCE=http_date()
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    self.guest.get(address, HTTP_IF_NONE_MATCH=etag)
+                    .status_code, 200
+                )
+        etag = self.auth.get(address)['ETag']
+        Comment.objects.create(post=self.post, author=self.user, text='new')
+        response = self.auth.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_lean_rows(self):
+        post = Post.objects.feed().get(pk=self.post.pk)
+        with self.assertNumQueries(1):
+            row = Post.objects.filter(pk=self.post.pk).rows()[0]
+            self.assertEqual(row.pk, post.pk)
+            self.assertEqual(row.text, post.text)
+            self.assertEqual(row.pub_date, post.pub_date)
+            self.assertEqual(row.card_version, post.card_version)
+            self.assertEqual(row.image, post.image.name)
+            self.assertEqual(row.author.get_full_name(),
+                             post.author.get_full_name())
+            self.assertEqual(row.group.slug, post.group.slug)
+        with self.assertRaises(AttributeError):
+            row.comments_count = 0
+
+    def test_syndication_feeds(self):
+        for fmt in ('rss', 'atom', 'json'):
+            for address in (
+                reverse('posts:index_feed', args=[fmt]),
+                reverse('posts:group_feed', args=[self.group.slug, fmt]),
+                reverse('posts:profile_feed', args=[self.user.username, fmt]),
+            ):
+                with self.subTest(address=address):
+                    response = self.guest.get(address)
+                    self.assertTrue(response.streaming)
+                    content = b''.join(response.streaming_content)
+                    if fmt == 'json':
+                        json.loads(content)
+                    else:
+                        ElementTree.fromstring(content)
+                    self.assertIn(self.post.text, content.decode())
+                    response = self.guest.get(
+                        address, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                    self.assertEqual(response.status_code, 304)
+        address = reverse('posts:index_feed', args=['json'])
+        response = self.guest.get(address)
+        feed = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(feed['items']), 1)
+        since = response['X-Feed-Since']
+        Post.objects.create(author=self.user, text='newer')
+        response = self.guest.get(address, {'since': since})
+        feed = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([item['content_text'] for item in feed['items']],
+                         ['newer'])
+        self.assertEqual(
+            self.guest.get(reverse('posts:index_feed', args=['xml']))
+            .status_code, 404
+        )
+
+    @override_settings(SYNDICATION_ITEMS=2)
+    def test_syndication_since_catches_up(self):
+        address = reverse('posts:index_feed', args=['json'])
+        response = self.guest.get(address)
+        b''.join(response.streaming_content)
+        since = response['X-Feed-Since']
+        texts = [f'later {i}' for i in range(5)]
+        for text in texts:
+            Post.objects.create(author=self.user, text=text)
+        received = []
+        etags = set()
+        for _ in range(4):
+            response = self.guest.get(address, {'since': since})
+            etags.add(response['ETag'])
+            feed = json.loads(b''.join(response.streaming_content))
+            received += [item['content_text'] for item in feed['items']]
+            since = response['X-Feed-Since']
+        self.assertEqual(received, texts)
+        self.assertEqual(len(etags), 4)
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_thumbnail_placeholder(self):
+        post = Post.objects.create(
+            author=self.user,
+            text='with image',
+            image=SimpleUploadedFile(
+                'placeholder.gif', self.small_gif, content_type='image/gif'
+            ),
+        )
+        address = reverse('posts:post_detail', args=[post.pk])
+        with mock.patch('posts.thumbnails.queue') as queue:
+            response = self.auth.get(address)
+        self.assertContains(response, 'thumbnail-placeholder.svg')
+        queue.assert_called_once()
+        etag = response['ETag']
+        with self.settings(THUMBNAIL_WORKERS=0):
+            thumbnails.queue(post.image)
+        # the edit time is left alone, the variants key a new card
+        self.assertEqual(Post.objects.get(pk=post.pk).updated, post.updated)
+        response = self.auth.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotContains(response, 'thumbnail-placeholder.svg')
+        self.assertContains(response, '/media/cache/')
+
+    def test_thumbnail_prefetch(self):
+        for i in range(3):
+            post = Post.objects.create(
+                author=self.user,
+                text=f'image {i}',
+                image=SimpleUploadedFile(
+                    f'prefetch{i}.gif', self.small_gif,
+                    content_type='image/gif'
+                ),
+            )
+            # a post from before the variants renders {% thumbnail %}
+            thumbnails.queue(post.image, [thumbnails.CARD])
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest.get(reverse('posts:index'))
+        self.assertContains(response, '/media/cache/', count=3)
+        lookups = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(lookups), 1)
+
+    def test_thumbnails_inline_in_transaction(self):
+        # the in-memory test database survives a close, a real one not
+        with transaction.atomic(), mock.patch(
+            'posts.thumbnails.close_old_connections'
+        ) as close:
+            post = Post.objects.create(
+                author=self.user,
+                text='inline',
+                image=SimpleUploadedFile(
+                    'inline.gif', self.small_gif, content_type='image/gif'
+                ),
+            )
+            thumbnails.queue(post.image)
+            Post.objects.create(author=self.user, text='after thumbnails')
+        close.assert_not_called()
+        self.assertTrue(Post.objects.get(pk=post.pk).image_variants)
+        self.assertTrue(
+            Post.objects.filter(text='after thumbnails').exists()
+        )
+
+    def test_image_variants(self):
+        self.auth.post(reverse('posts:post_create'), {
+            'text': 'with variants',
+            'image': SimpleUploadedFile(
+                'variants.gif', self.small_gif, content_type='image/gif'
+            ),
+        })
+        post = Post.objects.get(text='with variants')
+        variants = json.loads(post.image_variants)
+        self.assertEqual(len(variants), len(thumbnails.SIZES))
+        self.assertEqual(
+            sorted({variant['width'] for variant in variants}),
+            thumbnails.WIDTHS
+        )
+        picture = thumbnails.picture(post.image_variants)
+        self.assertEqual(picture['sources'][0]['type'], 'image/webp')
+        self.assertEqual(picture['width'], 960)
+        self.assertIn('320w', picture['srcset'])
+        response = self.guest.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>', count=1)
+        self.assertContains(response, picture['sources'][0]['srcset'])
+        response = self.guest.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertContains(response, picture['src'])
+
+    def test_shared_image(self):
+        posts = [
+            Post.objects.create(
+                author=self.user,
+                text=f'meme {i}',
+                image=SimpleUploadedFile(
+                    f'meme{i}.gif', self.small_gif, content_type='image/gif'
+                ),
+            )
+            for i in range(2)
+        ]
+        name = posts[0].image.name
+        self.assertEqual(posts[1].image.name, name)
+        storage = posts[0].image.storage
+        # the test transaction never commits, releases run right away
+        with mock.patch('django.db.transaction.on_commit', lambda f: f()):
+            posts[0].delete()
+            self.assertTrue(storage.exists(name))
+            posts[1].delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_shared_image_released_before_commit(self):
+        old = Post.objects.create(
+            author=self.user,
+            text='old meme',
+            image=SimpleUploadedFile(
+                'old.gif', self.small_gif, content_type='image/gif'
+            ),
+        )
+        name = old.image.name
+        storage = old.image.storage
+        save = storage.save
+
+        def released_meanwhile(*args, **kwargs):
+            # stored already, the upload is not written
+            self.assertEqual(save(*args, **kwargs), name)
+            old.delete()
+            self.assertFalse(storage.exists(name))
+            return name
+
+        with mock.patch('django.db.transaction.on_commit', lambda f: f()), \
+                mock.patch.object(storage, 'save', released_meanwhile):
+            new = Post.objects.create(
+                author=self.user,
+                text='new meme',
+                image=SimpleUploadedFile(
+                    'new.gif', self.small_gif, content_type='image/gif'
+                ),
+            )
+        self.assertEqual(new.image.name, name)
+        self.assertTrue(storage.exists(name))
+        with storage.open(name) as image:
+            self.assertEqual(image.read(), self.small_gif)
+
+    def test_shared_image_referenced_during_release(self):
+        post = Post.objects.create(
+            author=self.user,
+            text='meme',
+            image=SimpleUploadedFile(
+                'meme.gif', self.small_gif, content_type='image/gif'
+            ),
+        )
+        name = post.image.name
+        storage = post.image.storage
+        Post.objects.filter(pk=post.pk).update(image='')
+        set_aside = storage.set_aside
+
+        def committed_meanwhile(name):
+            aside = set_aside(name)
+            Post.objects.filter(pk=post.pk).update(image=name)
+            return aside
+
+        with mock.patch.object(storage, 'set_aside', committed_meanwhile), \
+                mock.patch('posts.thumbnails.queue') as queue:
+            thumbnails.release(name)
+        self.assertTrue(storage.exists(name))
+        queue.assert_called_once_with(name)
+
     def test_post_list_wrong_group(self):
         group1 = Group.objects.create(
             title='test grp1',
@@ -178,6 +587,132 @@ class PostViewTest(TestCase):
                                  + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 6)
 
+    def test_feed_queries_do_not_grow(self):
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:group', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+        )
+        counts = []
+        for posts in (0, 9):
+            Post.objects.bulk_create(
+                Post(text='test', author=self.user, group=self.group)
+                for _ in range(posts)
+            )
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                for address in addresses:
+                    self.auth.get(address)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_feed_count_cache(self):
+        key = feed_count_key('group', self.group.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                CachedCountPaginator(self.group.posts.all(), 10, key).count, 1
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                CachedCountPaginator(self.group.posts.all(), 10, key).count, 1
+            )
+        Post.objects.create(author=self.user, text='new', group=self.group)
+        self.assertEqual(cache.get(feed_count_key('group', self.group.pk)), 2)
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = None
+        post.save()
+        self.assertEqual(cache.get(feed_count_key('group', self.group.pk)), 1)
+        post = Post.objects.create(
+            author=self.user, text='new', group=self.group
+        )
+        post.save()
+        self.assertEqual(cache.get(feed_count_key('group', self.group.pk)), 2)
+
+    @override_settings(FEED_FANOUT_THRESHOLD=0)
+    def test_follow_count_cache(self):
+        Follow.objects.create(user=self.user1, author=self.user)
+        key = feed_count_key('follow', self.user1.pk)
+        self.auth.force_login(self.user1)
+        address = reverse('posts:follow_index')
+        self.assertEqual(
+            self.auth.get(address).context['page_obj'].paginator.count, 1
+        )
+        # only pushed posts are cached, pulled ones leave the key alone
+        self.assertEqual(cache.get(key), 0)
+        post = Post.objects.create(author=self.user, text='pulled')
+        self.assertEqual(cache.get(key), 0)
+        self.assertEqual(
+            self.auth.get(address).context['page_obj'].paginator.count, 2
+        )
+        post.delete()
+        self.assertEqual(cache.get(key), 0)
+        self.assertEqual(
+            self.auth.get(address).context['page_obj'].paginator.count, 1
+        )
+        with self.settings(FEED_FANOUT_THRESHOLD=1):
+            timeline.settle(self.user.pk)
+            self.assertIsNone(cache.get(key))
+            self.auth.get(address)
+            Post.objects.create(author=self.user, text='pushed')
+            self.assertIsNone(cache.get(key))
+            self.assertEqual(
+                self.auth.get(address).context['page_obj'].paginator.count,
+                2
+            )
+
+    def test_post_card_fragment(self):
+        post = Post.objects.get(pk=self.post.pk)
+        key = card_key(post, post.card_version)
+        self.auth.get(reverse('posts:group', args=[self.group.slug]))
+        self.assertIn('test text', cache.get(key))
+        post.text = 'edited text'
+        post.save()
+        self.assertIsNone(cache.get(key))
+        response = self.auth.get(reverse('posts:profile',
+                                         args=[self.user.username]))
+        self.assertContains(response, 'edited text')
+        key = card_key(post, post.card_version)
+        self.assertIsNotNone(cache.get(key))
+        post.delete()
+        self.assertIsNone(cache.get(key))
+
+    def test_post_card_fragment_renames(self):
+        post = Post.objects.feed().get(pk=self.post.pk)
+        render_to_string('includes/post_card.html', {'post': post})
+        User.objects.filter(pk=self.user.pk).update(first_name='renamed')
+        Group.objects.filter(pk=self.group.pk).update(slug='moved')
+        post = Post.objects.feed().get(pk=self.post.pk)
+        card = render_to_string('includes/post_card.html', {'post': post})
+        self.assertIn('renamed', card)
+        self.assertIn(reverse('posts:group', args=['moved']), card)
+
+    def test_cursor_paginator(self):
+        Post.objects.bulk_create(
+            Post(text=f'test {i}', author=self.user) for i in range(15)
+        )
+        address = reverse('posts:group', args=[self.group.slug])
+        Post.objects.update(group=self.group)
+        first = self.auth.get(address).context['page_obj']
+        response = self.auth.get(address,
+                                 {'after': encode_cursor(first[9])})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 6)
+        self.assertFalse(page_obj.has_next())
+        self.assertTrue(page_obj.has_previous())
+        self.assertEqual(page_obj[0].pk, first[9].pk - 1)
+        response = self.auth.get(address,
+                                 {'before': page_obj.previous_cursor})
+        self.assertEqual([p.pk for p in response.context['page_obj']],
+                         [p.pk for p in first])
+        self.assertFalse(response.context['page_obj'].has_previous())
+        response = self.auth.get(address,
+                                 {'before': encode_cursor(first[0])})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 0)
+        self.assertFalse(page_obj.has_next())
+        self.assertFalse(page_obj.has_previous())
+        self.assertNotContains(response, '?after=')
+
     def test_sub(self):
         c_count = Follow.objects.count()
         self.auth.post(
@@ -204,8 +739,133 @@ class PostViewTest(TestCase):
         )
         self.assertEqual(Follow.objects.count(), c_count)
 
+    def test_follow_index_timeline(self):
+        self.auth.force_login(self.user1)
+        self.auth.get(reverse('posts:profile_follow',
+                              args=[self.user.username]))
+        post = Post.objects.create(author=self.user, text='new')
+        self.assertEqual(Timeline.objects.filter(user=self.user1).count(), 2)
+        self.assertEqual(
+            Timeline.objects.get(user=self.user1, post=post).pub_date,
+            post.pub_date
+        )
+        response = self.auth.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 2)
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        response = self.auth.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.auth.get(reverse('posts:profile_unfollow',
+                              args=[self.user.username]))
+        self.assertFalse(Timeline.objects.exists())
+
+    def test_explain_feeds(self):
+        out = StringIO()
+        call_command('explain_feeds', stdout=out)
+        views = (
+            'index', 'group_posts', 'profile', 'post_detail comments',
+            'follow_index pushed', 'follow_index pulled',
+        )
+        for view in views:
+            with self.subTest(view=view):
+                self.assertIn(f'{view}: index=yes sort=no', out.getvalue())
+
+    @override_settings(FEED_FANOUT_THRESHOLD=0)
+    def test_follow_index_pulled_author(self):
+        Follow.objects.create(user=self.user1, author=self.user)
+        Post.objects.create(author=self.user, text='new')
+        self.assertFalse(Timeline.objects.exists())
+        self.auth.force_login(self.user1)
+        response = self.auth.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertIsInstance(response.context['page_obj'], Page)
+
+    @override_settings(FEED_FANOUT_THRESHOLD=1)
+    def test_follow_index_merge(self):
+        user2 = User.objects.create_user(username='auth2')
+        Follow.objects.create(user=self.user1, author=self.user)
+        Follow.objects.create(user=self.user1, author=user2)
+        Post.objects.create(author=user2, text='pushed, then pulled')
+        Follow.objects.create(user=self.user, author=user2)
+        for i in range(12):
+            Post.objects.create(author=self.user, text=f'pushed {i}')
+        for i in range(3):
+            Post.objects.create(author=user2, text=f'pulled {i}')
+        expected = list(Post.objects.filter(
+            author__in=[self.user, user2]
+        ).order_by('-pub_date', '-pk').values_list('pk', flat=True))
+        self.auth.force_login(self.user1)
+        address = reverse('posts:follow_index')
+        pages = [
+            self.auth.get(address, {'page': page}).context['page_obj']
+            for page in (1, 2)
+        ]
+        self.assertEqual(pages[0].paginator.count, len(expected))
+        self.assertEqual([p.pk for page in pages for p in page], expected)
+        last = pages[0][9]
+        page_obj = self.auth.get(
+            address, {'after': encode_cursor(last)}
+        ).context['page_obj']
+        self.assertEqual([p.pk for p in page_obj], expected[10:])
+        page_obj = self.auth.get(
+            address, {'before': page_obj.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual([p.pk for p in page_obj], expected[:10])
+
+    @override_settings(FEED_FANOUT_THRESHOLD=1)
+    def test_follow_index_counter_drift(self):
+        user2 = User.objects.create_user(username='auth2')
+        Follow.objects.create(user=self.user1, author=self.user)
+        Follow.objects.create(user=user2, author=self.user)
+        # a drifted counter decides for the write as for the read
+        UserStats.objects.filter(user=self.user).update(followers_count=1)
+        post = Post.objects.create(author=self.user, text='drifted')
+        self.auth.force_login(self.user1)
+        address = reverse('posts:follow_index')
+        self.assertIn(post, self.auth.get(address).context['page_obj'])
+
+    @override_settings(FEED_FANOUT_THRESHOLD=1)
+    def test_follow_index_reconciled_below_threshold(self):
+        Follow.objects.create(user=self.user1, author=self.user)
+        UserStats.objects.filter(user=self.user).update(followers_count=5)
+        post = Post.objects.create(author=self.user, text='pulled')
+        self.assertFalse(Timeline.objects.filter(post=post).exists())
+        counters.reconcile()
+        self.assertTrue(
+            Timeline.objects.filter(user=self.user1, post=post).exists()
+        )
+        self.auth.force_login(self.user1)
+        address = reverse('posts:follow_index')
+        self.assertIn(post, self.auth.get(address).context['page_obj'])
+
     def assert_post_context(self, obj):
         self.assertEqual(obj.text, self.post.text)
         self.assertEqual(obj.author.username, self.post.author.username)
         self.assertEqual(obj.group.title, self.post.group.title)
         self.assertEqual(obj.image, self.post.image)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=1)
+class ThumbnailWorkerTest(TransactionTestCase):
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x01\x00'
+        b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+        b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+        b'\x00\x00\x01\x00\x01\x00\x00\x02'
+        b'\x02\x4c\x01\x00\x3b'
+    )
+
+    def test_worker_makes_variants(self):
+        user = User.objects.create_user(username='auth')
+        post = Post.objects.create(
+            author=user,
+            text='in the background',
+            image=SimpleUploadedFile(
+                'worker.gif', self.small_gif, content_type='image/gif'
+            ),
+        )
+        thumbnails.queue(post.image)
+        # one worker runs its jobs in order, this one comes last
+        thumbnails._executor.submit(lambda: None).result(timeout=10)
+        variants = json.loads(Post.objects.get(pk=post.pk).image_variants)
+        self.assertEqual(len(variants), len(thumbnails.SIZES))
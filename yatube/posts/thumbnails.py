@@ -0,0 +1,310 @@
+import json
+import logging
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from django.templatetags.static import static
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# the card image {% thumbnail %} renders while a post has no variants
+CARD = ('960x339', {'crop': 'center', 'upscale': True})
+
+# widths of the variants made of a post image, the card is the largest
+WIDTHS = [320, 640, 960]
+
+
+def _geometry(width):
+    return f'{width}x{round(width * 339 / 960)}'
+
+
+# every variant of a post image made on upload, in its format and WEBP
+SIZES = [(_geometry(width), CARD[1]) for width in WIDTHS] + [
+    (_geometry(width), dict(CARD[1], format='WEBP')) for width in WIDTHS
+]
+
+# rendered width of a post image, for the browser to pick a variant
+IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+
+# sent by a worker once every size of an image is on the storage
+thumbnails_ready = Signal(providing_args=['name', 'variants'])
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+_prefetched = threading.local()
+
+
+def _source(file_):
+    # a bare name is a post image, opened from the storage of the field
+    if isinstance(file_, str):
+        return ImageFile(file_, Post._meta.get_field('image').storage)
+    return file_
+
+
+class Placeholder(DummyImageFile):
+    """Stands in for a thumbnail that is still being made"""
+
+    @property
+    def url(self):
+        return static('img/thumbnail-placeholder.svg')
+
+
+class PrefetchedKVStore(KVStore):
+    """sorl-thumbnail's cached DB store, answering from prefetch() first"""
+
+    def _get_raw(self, key):
+        values = getattr(_prefetched, 'values', None)
+        if values is None or key not in values:
+            return super()._get_raw(key)
+        if values[key] == EMPTY_VALUE:
+            return None
+        return values[key]
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        values = getattr(_prefetched, 'values', None)
+        if values is not None:
+            values[key] = value
+
+    def get_many_raw(self, keys):
+        """Values of many keys from one cache read and one query at most"""
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing
+            ).values_list('key', 'value'))
+            read = {key: found.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(read, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(read)
+        return values
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Thumbnails are made by a worker pool instead of the page render.
+
+    A thumbnail missing from the key-value store is queued and a
+    placeholder returned in its place. With THUMBNAIL_WORKERS = 0 they
+    are made in the render as sorl-thumbnail does by default.
+    """
+
+    def _options(self, source, options):
+        # the defaults get_thumbnail applies, they are part of the name
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """The ImageFile a thumbnail is stored as, made or not"""
+        source = ImageFile(_source(file_))
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self._options(source, options)
+        )
+        return ImageFile(name, default.storage)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if file_:
+            file_ = _source(file_)
+        if not file_ or not settings.THUMBNAIL_WORKERS:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        cached = default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+        if cached:
+            return cached
+        size = (geometry_string, options)
+        # the card of a post made before its variants brings them along
+        queue(file_, SIZES if size == CARD else [size])
+        return Placeholder(geometry_string)
+
+    def make(self, file_, geometry_string, **options):
+        return super().get_thumbnail(
+            _source(file_), geometry_string, **options
+        )
+
+
+def make(name, sizes=SIZES):
+    """Make the thumbnails of an image now, returns their metadata"""
+    variants = []
+    for geometry, options in sizes:
+        thumbnail = default.backend.make(name, geometry, **options)
+        variants.append({
+            'name': thumbnail.name,
+            'width': thumbnail.width,
+            'height': thumbnail.height,
+            'type': mimetypes.guess_type(thumbnail.name)[0],
+        })
+    # the post keeps the metadata of a full set only
+    thumbnails_ready.send(
+        sender=QueuedThumbnailBackend, name=name,
+        variants=variants if list(sizes) == SIZES else None
+    )
+    return variants
+
+
+def _make(name, sizes):
+    try:
+        make(name, sizes)
+    except Exception:
+        logger.exception('Thumbnails of %s failed', name)
+
+
+def _work(name, sizes, key):
+    # a worker thread owns its connection, a request must keep its own
+    close_old_connections()
+    try:
+        _make(name, sizes)
+    finally:
+        with _lock:
+            _pending.discard(key)
+        close_old_connections()
+
+
+def _submit(name, sizes):
+    global _executor
+    key = (name, repr(sizes))
+    with _lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+    _executor.submit(_work, name, sizes, key)
+
+
+def queue(image, sizes=SIZES):
+    """Make the thumbnails of an image in the background, once at a time"""
+    name = getattr(image, 'name', image)
+    if not name:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        return _make(name, sizes)
+    # the worker finds the posts by image name, they must be committed
+    transaction.on_commit(partial(_submit, name, sizes))
+
+
+def release(name):
+    """Delete an image and its thumbnails once no post refers to it.
+
+    A post saving the same bytes meanwhile reuses the stored file without
+    writing it. The file is set aside before a second check, so such a
+    post either shows up there and the file is put back, or is committed
+    after it and has retain() write the file again.
+    """
+    if not name or Post.objects.filter(image=name).exists():
+        return
+    storage = Post._meta.get_field('image').storage
+    try:
+        aside = storage.set_aside(name)
+        # thumbnails go first, whoever keeps the image makes them again
+        default.backend.delete(_source(name), delete_file=False)
+        if Post.objects.filter(image=name).exists():
+            if aside is not None:
+                storage.put_back(aside, name)
+            queue(name)
+        elif aside is not None:
+            storage.delete(aside)
+    except (OSError, SuspiciousFileOperation) as error:
+        # a leftover file is harmless, a failed request is not
+        logger.warning('Could not release %s: %s', name, error)
+
+
+def retain(image):
+    """Write a committed post image again if a release removed it"""
+    if not image:
+        return
+    try:
+        if not image.storage.exists(image.name):
+            image.storage.restore(image.name, image.file)
+    except (OSError, SuspiciousFileOperation) as error:
+        logger.warning('Could not restore %s: %s', image.name, error)
+
+
+def _srcset(variants):
+    return ', '.join(
+        f'{default.storage.url(variant["name"])} {variant["width"]}w'
+        for variant in variants
+    )
+
+
+def picture(variants):
+    """The <picture> of a post image from its variants JSON, or None.
+
+    The variants in the format of the upload make the <img>, the largest
+    one its src, and the WEBP ones a <source> ahead of it.
+    """
+    try:
+        variants = json.loads(variants) if variants else []
+    except ValueError:
+        return None
+    types = {}
+    # a WEBP upload makes the same files twice
+    unique = {variant['name']: variant for variant in variants}
+    for variant in sorted(unique.values(), key=lambda v: v['width']):
+        types.setdefault(variant['type'], []).append(variant)
+    if not types:
+        return None
+    webp = types.pop('image/webp') if len(types) > 1 else None
+    sources = []
+    if webp:
+        sources.append({'type': 'image/webp', 'srcset': _srcset(webp)})
+    img = types.popitem()[1]
+    return {
+        'sources': sources,
+        'src': default.storage.url(img[-1]['name']),
+        'srcset': _srcset(img),
+        'width': img[-1]['width'],
+        'height': img[-1]['height'],
+        'sizes': IMAGE_SIZES,
+    }
+
+
+@contextmanager
+def prefetch(posts, sizes=(CARD,)):
+    """Look up the thumbnails of every post on a page in one batch.
+
+    {% thumbnail %} tags rendered inside the block read the store
+    entries from memory instead of one cache or DB round trip each.
+    Posts with variants render those and need no lookup.
+    """
+    keys = [
+        add_prefix(default.backend.thumbnail_file(
+            post.image, geometry, **options
+        ).key)
+        for post in posts if post.image and not post.image_variants
+        for geometry, options in sizes
+    ]
+    outer = getattr(_prefetched, 'values', None)
+    _prefetched.values = default.kvstore.get_many_raw(keys) if keys else {}
+    try:
+        yield
+    finally:
+        _prefetched.values = outer
@@ -0,0 +1,201 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Follow, Post, Timeline, UserStats
+from .utils import feed_count, feed_count_key, keyset, paginate
+
+BATCH_SIZE = 500
+
+
+def _push(user_ids, posts):
+    """Timeline rows of (id, pub_date) posts for every user"""
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for user_id in user_ids
+            for post_id, pub_date in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _followers(author_id):
+    return Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+
+
+def followers(author_id):
+    """Follower count of an author, read from the counters table"""
+    return UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def is_pulled(author_id):
+    """Whether the author is read at request time instead of pushed.
+
+    Decided by the counters table, as pulled_authors() is for the read,
+    so that every post is either pushed or pulled.
+    """
+    return followers(author_id) > settings.FEED_FANOUT_THRESHOLD
+
+
+def pulled_authors(user=None):
+    """Ids of followed authors whose posts are merged in at read time"""
+    stats = UserStats.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_THRESHOLD
+    )
+    if user is not None:
+        stats = stats.filter(user__following__user=user)
+    return stats.values_list('user_id', flat=True)
+
+
+def _forget_counts(user_ids):
+    cache.delete_many(
+        [feed_count_key('follow', user_id) for user_id in user_ids]
+    )
+
+
+def forget_counts(author_id):
+    """Drop the cached follow feed totals of the followers of an author.
+
+    Only pushed posts are in the cached totals, a pulled author's posts
+    leave them alone.
+    """
+    if not is_pulled(author_id):
+        _forget_counts(_followers(author_id))
+
+
+def fan_out(post):
+    """Push a new post into the timeline of every follower of its author"""
+    if is_pulled(post.author_id):
+        return
+    followers = list(_followers(post.author_id))
+    _push(followers, [(post.pk, post.pub_date)])
+    _forget_counts(followers)
+
+
+def _author_posts(author_id):
+    return Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+
+
+def backfill(user, author):
+    """Copy all posts of a freshly followed author into user's timeline"""
+    if not is_pulled(author.pk):
+        _push([user.pk], _author_posts(author.pk))
+
+
+def settle(author_id):
+    """Fit the followers' timelines to an author who crossed the threshold.
+
+    An author dropping back to it has the posts written while pulled
+    pushed, they are missing from the timelines. Either way the cached
+    totals of the followers now count a different set of rows.
+    """
+    followers = list(_followers(author_id))
+    if not is_pulled(author_id):
+        _push(followers, _author_posts(author_id))
+    _forget_counts(followers)
+
+
+def prune(user, author):
+    """Drop posts of an unfollowed author from user's timeline"""
+    Timeline.objects.filter(user=user, post__author=author).delete()
+
+
+def rebuild():
+    """Recreate every timeline from Follow and Post, returns rows written"""
+    with transaction.atomic():
+        Timeline.objects.all().delete()
+        follows = Follow.objects.exclude(
+            author__in=list(pulled_authors())
+        ).values_list('user_id', 'author_id')
+        for user_id, author_id in follows.iterator():
+            _push([user_id], _author_posts(author_id))
+    return Timeline.objects.count()
+
+
+class FollowFeed:
+    """The follow feed of a user, merged on read from two indexed queries.
+
+    Pushed posts come from the user's timeline rows, posts of pulled
+    authors from their own posts. Each query is limited to the rows a
+    page can take, the merge keeps the newest of both by (pub_date, id).
+    A post pushed before its author was pulled is found by both and kept
+    once. posts is the queryset the page is finally read from.
+    """
+
+    def __init__(self, user, posts=None):
+        self.user = user
+        self.posts = Post.objects.feed() if posts is None else posts
+        self.pulled = list(pulled_authors(user))
+
+    def pushed(self, after=None, before=None):
+        """(pub_date, id) of the posts in the user's timeline.
+
+        A range scan of timeline_user_pub_date_idx, posts are not joined.
+        """
+        return keyset(
+            Timeline.objects.filter(user=self.user), after, before,
+            pk='post_id'
+        ).values_list('pub_date', 'post_id')
+
+    def pulled_posts(self, after=None, before=None):
+        """(pub_date, id) of the posts of the pulled authors"""
+        return keyset(
+            Post.objects.filter(author__in=self.pulled), after, before
+        ).values_list('pub_date', 'pk')
+
+    def keys(self, after=None, before=None, start=0, stop=None):
+        """(pub_date, id) of the posts [start:stop] past a cursor"""
+        # with one source the offset is left to the database
+        first = 0 if self.pulled else start
+        keys = list(self.pushed(after, before)[first:stop])
+        if not self.pulled:
+            return keys
+        pulled = self.pulled_posts(after, before)[:stop]
+        newest_first = before is None or after is not None
+        return sorted(
+            set(keys).union(pulled), reverse=newest_first
+        )[start:stop]
+
+    def window(self, after=None, before=None, start=0, stop=None):
+        """Posts [start:stop] past a cursor, in the order of keys()"""
+        keys = self.keys(after, before, start, stop)
+        posts = {
+            post.pk: post
+            for post in self.posts.filter(pk__in=[pk for _, pk in keys])
+        }
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def __getitem__(self, index):
+        return self.window(start=index.start, stop=index.stop)
+
+    def count(self):
+        """Posts of the feed, the pushed ones counted once and cached.
+
+        Pulled authors add their posts counters, so their posts never
+        touch the cached totals of their followers.
+        """
+        pushed = feed_count(
+            feed_count_key('follow', self.user.pk),
+            Timeline.objects.filter(user=self.user).exclude(
+                post__author__in=self.pulled
+            )
+        )
+        if not self.pulled:
+            return pushed
+        return pushed + UserStats.objects.filter(
+            user_id__in=self.pulled
+        ).aggregate(total=Sum('posts_count'))['total']
+
+
+def build_feed(request):
+    """Page of the follow feed for posts/follow.html"""
+    return paginate(request, FollowFeed(request.user))
@@ -10,6 +10,11 @@ urlpatterns = [
         views.index,
         name='index'
     ),
+    path(
+        'feed/<str:fmt>/',
+        views.index_feed,
+        name='index_feed'
+    ),
     path(
         'create/',
         views.post_create,
@@ -20,11 +25,21 @@ urlpatterns = [
         views.group_posts,
         name='group'
     ),
+    path(
+        'group/<slug:slug>/feed/<str:fmt>/',
+        views.group_feed,
+        name='group_feed'
+    ),
     path(
         'profile/<str:username>/',
         views.profile,
         name='profile'
     ),
+    path(
+        'profile/<str:username>/feed/<str:fmt>/',
+        views.profile_feed,
+        name='profile_feed'
+    ),
     path(
         'posts/<int:post_id>/',
         views.post_detail,
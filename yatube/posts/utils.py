@@ -1,9 +1,203 @@
-from django.core.paginator import Paginator
+import re
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
-def paginate(request, obj):
-    """Paginator function"""
-    p = Paginator(obj, 10)
+POSTS_PER_PAGE = 10
+
+
+def encode_position(pub_date, pk):
+    """Opaque token for a (pub_date, id) position, read by decode_cursor"""
+    raw = f'{pub_date.isoformat()}|{pk}'
+    return urlsafe_base64_encode(raw.encode())
+
+
+def encode_cursor(post):
+    """Opaque token for the (pub_date, id) position of a post"""
+    return encode_position(post.pub_date, post.pk)
+
+
+def decode_cursor(token):
+    """Position encoded by encode_cursor, None for a broken token"""
+    if not token:
+        return None
+    try:
+        pub_date, pk = force_str(urlsafe_base64_decode(token)).split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Page):
+    """Keyset page, it knows its neighbours but not its number"""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = None
+        self.previous_cursor = None
+        if object_list:
+            self.next_cursor = encode_cursor(object_list[-1])
+            self.previous_cursor = encode_cursor(object_list[0])
+
+    def __repr__(self):
+        return f'<Cursor page after {self.previous_cursor}>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+def keyset(queryset, after=None, before=None, pk='pk'):
+    """queryset past a cursor in feed order, oldest first before one
+
+    pk names the column that breaks pub_date ties, post_id for rows that
+    refer to posts.
+    """
+    if after is not None:
+        pub_date, key = after
+        return queryset.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, **{f'{pk}__lt': key})
+        ).order_by('-pub_date', f'-{pk}')
+    if before is not None:
+        pub_date, key = before
+        return queryset.filter(
+            Q(pub_date__gt=pub_date)
+            | Q(pub_date=pub_date, **{f'{pk}__gt': key})
+        ).order_by('pub_date', pk)
+    return queryset.order_by('-pub_date', f'-{pk}')
+
+
+class CursorPaginator(Paginator):
+    """Keyset paginator over (pub_date, id), newest first.
+
+    Pages are fetched with a range condition on the sort key instead of
+    OFFSET, and no COUNT(*) is issued unless count is read explicitly.
+    A feed that is not one queryset, such as timeline.FollowFeed, reads
+    its pages with window().
+    """
+
+    def __init__(self, object_list, per_page, **kwargs):
+        if isinstance(object_list, QuerySet):
+            object_list = object_list.order_by('-pub_date', '-pk')
+        super().__init__(object_list, per_page, **kwargs)
+
+    def get_cursor_page(self, after=None, before=None):
+        limit = self.per_page + 1
+        if isinstance(self.object_list, QuerySet):
+            posts = list(keyset(self.object_list, after, before)[:limit])
+        else:
+            posts = self.object_list.window(after, before, stop=limit)
+        has_more = len(posts) > self.per_page
+        posts = posts[:self.per_page]
+        # an empty page has no cursor to step back or forth from
+        if before is not None and after is None:
+            posts.reverse()
+            return CursorPage(posts, self, bool(posts), has_more)
+        return CursorPage(
+            posts, self, has_more, after is not None and bool(posts)
+        )
+
+
+def feed_count_key(feed, pk=None):
+    """Cache key of a feed total: global, group, author or follow"""
+    if pk is None:
+        return f'feed_count:{feed}'
+    return f'feed_count:{feed}:{pk}'
+
+
+def estimate_count(queryset):
+    """Row count of a feed, the planner estimate past FEED_COUNT_EXACT_LIMIT
+
+    Only PostgreSQL exposes an estimate, other backends count exactly.
+    """
+    queryset = queryset.order_by()
+    limit = settings.FEED_COUNT_EXACT_LIMIT
+    total = queryset[:limit + 1].count()
+    if total <= limit:
+        return total
+    if connections[queryset.db].vendor == 'postgresql':
+        rows = re.search(r'rows=(\d+)', queryset.explain())
+        if rows:
+            return max(int(rows.group(1)), total)
+    return queryset.count()
+
+
+def feed_count(key, posts):
+    """Cached total of a feed, kept current by incr_feed_counts"""
+    total = cache.get(key)
+    if total is None:
+        if isinstance(posts, QuerySet):
+            total = estimate_count(posts)
+        else:
+            total = posts.count()
+        cache.add(key, total, settings.FEED_COUNT_TIMEOUT)
+    return total
+
+
+def incr_feed_counts(keys, delta):
+    """Shift cached totals after a write, missing keys stay missing"""
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator whose count comes from the feed count cache.
+
+    Pages are sliced by per_page alone, a slightly stale total can only
+    shift the page range, never cut posts off a page.
+    """
+
+    def __init__(self, object_list, per_page, count_key, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        return feed_count(self.count_key, self.object_list)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        return self._get_page(self.object_list[bottom:top], number, self)
+
+
+def paginate(request, obj, per_page=POSTS_PER_PAGE, count_key=None):
+    """Paginator function
+
+    Offset pages are used unless the request carries an ?after=/?before=
+    cursor or POSTS_CURSOR_PAGINATION is on, then the count is skipped.
+    With count_key the total is read from the feed count cache.
+    """
+    after = decode_cursor(request.GET.get('after'))
+    before = decode_cursor(request.GET.get('before'))
+    if after or before or settings.POSTS_CURSOR_PAGINATION:
+        p = CursorPaginator(obj, per_page)
+        return p.get_cursor_page(after=after, before=before)
+    if count_key is None:
+        p = Paginator(obj, per_page)
+    else:
+        p = CachedCountPaginator(obj, per_page, count_key)
     p_num = request.GET.get('page')
     p_obj = p.get_page(p_num)
     return p_obj
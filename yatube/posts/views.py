@@ -1,81 +1,138 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
+from . import thumbnails
+from .caching import cache_feed, feed_version_key, post_etag
+from .counters import stats_for
 from .forms import PostForm, CommentForm
 from .models import Group, Post, User, Follow
-from .utils import paginate
+from .syndication import syndicate
+from .timeline import build_feed
+from .utils import feed_count_key, paginate
 
 
-@cache_page(60)
+def _feed(posts):
+    if settings.FEED_LEAN_ROWS:
+        return posts.rows()
+    return posts.feed()
+
+
+@cache_feed(lambda: [feed_version_key('global')])
 def index(request):
     """Project main page with all posts listed"""
-    post_list = Post.objects.all().order_by('-pub_date')
-    page_obj = paginate(request, post_list)
+    post_list = _feed(Post.objects)
+    page_obj = paginate(
+        request,
+        post_list,
+        count_key=feed_count_key('global')
+    )
     context = {
         "page_obj": page_obj,
     }
-    return render(request, 'posts/index.html', context)
+    with thumbnails.prefetch(page_obj):
+        return render(request, 'posts/index.html', context)
 
 
+@cache_feed(lambda slug: [feed_version_key('group', slug)])
 def group_posts(request, slug):
     """Posts list sorted by group"""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = paginate(request, posts)
+    posts = _feed(group.posts)
+    page_obj = paginate(
+        request,
+        posts,
+        count_key=feed_count_key('group', group.pk)
+    )
     context = {
         "group": group,
         "page_obj": page_obj,
     }
-    return render(request, "posts/group_list.html", context)
+    with thumbnails.prefetch(page_obj):
+        return render(request, "posts/group_list.html", context)
 
 
+@cache_feed(lambda username: [feed_version_key('author', username)])
 def profile(request, username):
     """Profile page with user posts"""
-    author = get_object_or_404(User, username=username)
-    f = False
-    if request.user.is_authenticated:
-        f = Follow.objects.filter(
-            user=request.user,
-            author=author
-        ).exists()
-    if f:
-        following = True
-    else:
-        following = False
-    post_all = author.posts.all()
-    page_obj = paginate(request, post_all)
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username
+    )
+    post_all = _feed(author.posts)
+    page_obj = paginate(
+        request,
+        post_all,
+        count_key=feed_count_key('author', author.pk)
+    )
     context = {
         'author': author,
+        'stats': stats_for(author),
         'page_obj': page_obj,
-        'following': following
     }
-    return render(request, 'posts/profile.html', context)
+    with thumbnails.prefetch(page_obj):
+        return render(request, 'posts/profile.html', context)
 
 
+@cache_control(max_age=0)
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
     """Post detailed information"""
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'author__stats', 'group'),
+        pk=post_id
+    )
+    comments = post.comments.select_related('author').order_by('created')
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
+        'author_stats': stats_for(post.author),
         'comments': comments,
         'form': form,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def index_feed(request, fmt):
+    """All posts as RSS, Atom or JSON Feed"""
+    return syndicate(
+        request, fmt, 'Yatube', reverse('posts:index'),
+        Post.objects.all(), [feed_version_key('global')]
+    )
+
+
+def group_feed(request, slug, fmt):
+    """Posts of a group as RSS, Atom or JSON Feed"""
+    group = get_object_or_404(Group, slug=slug)
+    return syndicate(
+        request, fmt, group.title, reverse('posts:group', args=[slug]),
+        group.posts.all(), [feed_version_key('group', slug)]
+    )
+
+
+def profile_feed(request, username, fmt):
+    """Posts of an author as RSS, Atom or JSON Feed"""
+    author = get_object_or_404(User, username=username)
+    return syndicate(
+        request, fmt, author.get_full_name() or author.username,
+        reverse('posts:profile', args=[username]),
+        author.posts.all(), [feed_version_key('author', username)]
+    )
+
+
 @login_required
 def post_create(request):
     """Post creation form"""
     if request.method == 'POST':
-        form = PostForm(request.POST)
+        form = PostForm(request.POST, files=request.FILES or None)
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
             form.save()
+            thumbnails.queue(post.image)
             return redirect(
                 reverse(
                     'posts:profile',
@@ -100,7 +157,13 @@ def post_edit(request, post_id):
             instance=post_inst
         )
         if form.is_valid():
-            form.save()
+            post = form.save(commit=False)
+            if 'image' in form.changed_data:
+                # variants of the old image must not outlive it
+                post.image_variants = ''
+            post.save()
+            if 'image' in form.changed_data:
+                thumbnails.queue(post.image)
             return redirect('posts:post_detail', post_id)
         context = {
             "form": form,
@@ -125,13 +188,12 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    follows = Follow.objects.filter(user=request.user)
-    posts = Post.objects.filter(author__following__in=follows)
-    page_obj = paginate(request, posts)
+    page_obj = build_feed(request)
     context = {
         'page_obj': page_obj,
     }
-    return render(request, 'posts/follow.html', context)
+    with thumbnails.prefetch(page_obj):
+        return render(request, 'posts/follow.html', context)
 
 
 @login_required
@@ -156,5 +218,5 @@ def profile_follow(request, username):
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(author=author).delete()
+    Follow.objects.filter(user=request.user, author=author).delete()
     return render(request, 'posts/index.html')
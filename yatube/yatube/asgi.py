@@ -0,0 +1,29 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The Django application is served through a bridge that runs it on a bounded
+thread pool, the long-poll and server-sent events endpoints of the API are
+served by asyncio handlers that hold no thread while they wait.
+
+Run it with any ASGI server, e.g. ``uvicorn yatube.asgi:application``.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+django_application = get_wsgi_application()
+
+from api import streams  # noqa: E402 the apps have to be loaded first
+from core.asgi import Router, WsgiBridge  # noqa: E402
+
+application = Router(
+    {
+        '/api/stream/poll/': streams.long_poll,
+        '/api/stream/events/': streams.events,
+    },
+    WsgiBridge(django_application)
+)
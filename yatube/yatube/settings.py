@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -38,6 +39,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -97,10 +100,17 @@ AUTH_PASSWORD_VALIDATORS = [
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
+# Test runs keep their caches in a temporary directory, see core.runner
+TEST_RUNNER = 'core.runner.TestRunner'
+
 LANGUAGE_CODE = 'ru'
 TIME_ZONE = 'UTC'
 
@@ -114,9 +124,22 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 STATIC_ROOT = os.path.join(BASE_DIR, "static_root")
 
+# collectstatic names files by content hash in a manifest and writes .gz
+# siblings of text assets; core.media.serve_static sends those to clients
+# that accept gzip and keeps hashed names STATIC_CACHE_TIMEOUT seconds
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+STATIC_CACHE_TIMEOUT = 60 * 60 * 24 * 365
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# core.media.serve: 'sendfile' hands files to the front server with
+# X-Sendfile, 'accel' with X-Accel-Redirect to an internal location at
+# MEDIA_ACCEL_PREFIX; None sends them from Django
+MEDIA_OFFLOAD = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CACHE_TIMEOUT = 60 * 60 * 24 * 365
+
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
@@ -126,3 +149,91 @@ LOGIN_REDIRECT_URL = 'posts:index'
 
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+
+# Keyset pages (?after=/?before=) for every feed, no COUNT(*) per request
+POSTS_CURSOR_PAGINATION = False
+
+# Authors with more followers are pulled into follow feeds at read time
+# instead of being fanned out to every follower's timeline on write
+FEED_FANOUT_THRESHOLD = 1000
+
+# Feed totals for the paginator are cached and moved on writes; past the
+# limit PostgreSQL planner estimates are used instead of COUNT(*)
+FEED_COUNT_TIMEOUT = 60 * 60
+FEED_COUNT_EXACT_LIMIT = 10000
+
+# 'versioned': feed pages are cached until a write bumps their feed version,
+# 'ttl': feed pages expire after FEED_PAGE_CACHE_TTL seconds
+FEED_PAGE_CACHE = 'versioned'
+FEED_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+FEED_PAGE_CACHE_TTL = 60
+
+# Expired pages are served stale for this long while one request holding
+# the lock rebuilds them; BETA > 1 refreshes busy pages earlier
+FEED_PAGE_STALE_TIMEOUT = 60 * 5
+FEED_PAGE_CACHE_LOCK_TIMEOUT = 30
+FEED_PAGE_CACHE_BETA = 1.0
+# A request missing a page another one is rendering waits this long for it
+FEED_PAGE_CACHE_WAIT = 2
+
+# Page cache outcomes are counted per process and added to the shared
+# totals at most this often, in seconds
+FEED_PAGE_METRICS_INTERVAL = 10
+
+# index, group and profile pages read plain rows instead of model instances
+FEED_LEAN_ROWS = True
+
+# Newest posts in an RSS, Atom or JSON feed response
+SYNDICATION_ITEMS = 100
+
+# asgi.py: threads running Django and the ORM, however many clients wait;
+# long polls and event streams check for new posts every interval
+ASGI_THREADS = 8
+STREAM_POLL_INTERVAL = 1
+STREAM_TIMEOUT = 30
+STREAM_HEARTBEAT = 15
+# a failed read of new posts is retried, waiting up to this long between
+STREAM_RETRY_MAX = 30
+
+# Thumbnails are made by THUMBNAIL_WORKERS background threads, pages show
+# a placeholder until then; 0 makes them in the render, as the test runner
+# sets it so that no thread outlives the test and its database
+THUMBNAIL_BACKEND = 'posts.thumbnails.QueuedThumbnailBackend'
+THUMBNAIL_KVSTORE = 'posts.thumbnails.PrefetchedKVStore'
+THUMBNAIL_WORKERS = 2
+
+# Uploads past UPLOAD_MAX_BYTES stop being stored and fail validation;
+# post images are downscaled to IMAGE_MAX_SIZE pixels on the longer side
+# and stored without EXIF, re-encoded at IMAGE_QUALITY
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.CappedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_MAX_SIZE = 2048
+IMAGE_QUALITY = 85
+
+# core.middleware.CompressionMiddleware gzips responses of these types
+# from COMPRESSION_MIN_SIZE bytes on; cached feed pages keep their static
+# parts deflated, a hit only compresses its per-user holes
+COMPRESSION_LEVEL = 6
+COMPRESSION_MIN_SIZE = 512
+COMPRESSION_TYPES = (
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/feed+json',
+    'application/rss+xml',
+    'application/atom+xml',
+    'application/xml',
+    'image/svg+xml',
+)
+
+# DEBUG only: warn (or raise) when a request issues more queries
+QUERY_BUDGET = 15
+QUERY_BUDGET_RAISE = False